@@ -0,0 +1,331 @@
+"""
+Benchmark offline de la API de BolsaIA.
+
+Arranca main.app con uvicorn en un puerto local, sustituye los upstreams por los
+stubs de bench/stubs.py y simula usuarios del dashboard haciendo polling. Las respuestas
+202 de la cola de trabajos se siguen hasta el resultado, como hace el frontend, así que
+la latencia medida es la completa.
+
+Uso (desde backend/):
+    python -m bench.run --users 20 --duration 30
+    python -m bench.run --latency yfinance=400 --fail finviz=0.5
+    python -m bench.run --output results.json
+    python -m bench.run --baseline results.json --tolerance 0.25   # exit 1 si hay regresión
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.stubs import Stubs, UpstreamProfile, default_profiles, fixture_info  # noqa: E402
+from cache import MemoryCache, set_cache  # noqa: E402
+from resilience import reset_upstreams  # noqa: E402
+
+PORTFOLIO_SYMBOLS = ["AAPL", "MSFT", "NVDA", "SAN.MC", "ITX.MC", "IQQD.DE", "QQQ3.MI", "VOD.L"]
+SIDEBAR_SYMBOLS = ["ES=F", "NQ=F", "RTY=F", "^GDAXI", "^IBEX", "GC=F", "SI=F", "CL=F", "NG=F", "BTC-USD", "ETH-USD"]
+WATCHLIST_SYMBOLS = ["AAPL", "NVDA", "BTC-USD", "SAN.MC"]
+CHART_PERIODS = ["1mo", "1mo", "6mo", "1y", "5y", "max"]
+
+
+def _portfolio_payload():
+    return {"portfolios": [{
+        "id": "bench", "name": "Bench", "color": "#3B82F6",
+        "holdings": [
+            {"id": str(i), "symbol": s, "isin": "", "date": "2024-01-02", "shares": 10, "price": 100, "fees": 0}
+            for i, s in enumerate(PORTFOLIO_SYMBOLS)
+        ],
+    }]}
+
+
+def _statement(rng, rows=50):
+    """Extracto CSV genérico; uno de cada cuatro sin precio (se rellena con el histórico)"""
+    lines = ["date,symbol,quantity,price"]
+    for _ in range(rows):
+        price = "" if rng.random() < 0.25 else f"{rng.uniform(10, 500):.2f}"
+        lines.append(f"2024-0{rng.randint(1, 9)}-1{rng.randint(0, 9)},{rng.choice(PORTFOLIO_SYMBOLS)},"
+                     f"{rng.randint(1, 50)},{price}")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _job_payload(r):
+    return {"kind": r.choice(["news", "sentiment", "chart"]), "symbol": r.choice(PORTFOLIO_SYMBOLS)}
+
+
+# (name, weight, request builder). Weights mimic the dashboard: App and MarketSidebar poll
+# /api/quotes every 60s, WatchlistsManager every 30s, and users open a stock now and then.
+# A bytes body is sent as is (CSV), anything else as JSON.
+ACTIONS = [
+    ("POST /api/quotes (portfolios)", 20, lambda r: ("POST", "/api/quotes", {"symbols": PORTFOLIO_SYMBOLS})),
+    ("POST /api/quotes (sidebar)", 20, lambda r: ("POST", "/api/quotes", {"symbols": SIDEBAR_SYMBOLS})),
+    ("POST /api/quotes (watchlist)", 40, lambda r: ("POST", "/api/quotes", {"symbols": WATCHLIST_SYMBOLS})),
+    ("GET /api/quote/{symbol}", 8, lambda r: ("GET", f"/api/quote/{r.choice(PORTFOLIO_SYMBOLS)}", None)),
+    ("GET /api/chart/{symbol}", 8, lambda r: (
+        "GET", f"/api/chart/{r.choice(PORTFOLIO_SYMBOLS)}?period={r.choice(CHART_PERIODS)}&interval=1d", None)),
+    ("GET /api/news/{symbol}", 5, lambda r: ("GET", f"/api/news/{r.choice(PORTFOLIO_SYMBOLS)}", None)),
+    ("GET /api/sentiment/{symbol}", 4, lambda r: ("GET", f"/api/sentiment/{r.choice(PORTFOLIO_SYMBOLS)}", None)),
+    ("GET /api/dividends/{symbol}", 5, lambda r: ("GET", f"/api/dividends/{r.choice(PORTFOLIO_SYMBOLS)}", None)),
+    ("GET /api/market-sentiment", 5, lambda r: ("GET", "/api/market-sentiment", None)),
+    ("GET /api/search", 3, lambda r: ("GET", f"/api/search?q={r.choice(['apple', 'santander', 'nvidia'])}", None)),
+    ("GET /api/price-at-date/{symbol}/{date}", 3, lambda r: (
+        "GET", f"/api/price-at-date/{r.choice(PORTFOLIO_SYMBOLS)}/2024-0{r.randint(1, 9)}-1{r.randint(0, 9)}", None)),
+    ("GET /api/portfolios", 4, lambda r: ("GET", "/api/portfolios", None)),
+    ("POST /api/portfolios", 1, lambda r: ("POST", "/api/portfolios", _portfolio_payload())),
+    ("POST /api/portfolios/{id}/import", 1, lambda r: ("POST", "/api/portfolios/bench/import", _statement(r))),
+    ("POST /api/jobs", 2, lambda r: ("POST", "/api/jobs", _job_payload(r))),
+]
+
+# Like client.js: slow analytics answer 202 + X-Job-Id right away and the client polls
+REQUEST_HEADERS = {"Prefer": "respond-async"}
+# These poll the job status (/api/jobs/{id}) before fetching the result; the rest go
+# straight to /api/jobs/{id}/result like client.js
+STATUS_POLLING = {"POST /api/jobs"}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, name, elapsed, ok):
+        with self._lock:
+            self.latencies[name].append(elapsed)
+            if not ok:
+                self.errors[name] += 1
+
+    def report(self, wall_time):
+        endpoints = {}
+        all_latencies = []
+        for name, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            all_latencies.extend(values)
+            endpoints[name] = {
+                "count": len(values),
+                "errors": self.errors[name],
+                "p50_ms": round(percentile(values, 50) * 1000, 1),
+                "p95_ms": round(percentile(values, 95) * 1000, 1),
+                "p99_ms": round(percentile(values, 99) * 1000, 1),
+            }
+        all_latencies.sort()
+        return {
+            "requests": len(all_latencies),
+            "errors": sum(self.errors.values()),
+            "duration_s": round(wall_time, 2),
+            "throughput_rps": round(len(all_latencies) / wall_time, 2) if wall_time else 0,
+            "p50_ms": round(percentile(all_latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(all_latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(all_latencies, 99) * 1000, 1),
+            "endpoints": endpoints,
+        }
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app, port):
+    import uvicorn
+
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 15
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("uvicorn did not start")
+        time.sleep(0.05)
+    return server, thread
+
+
+def await_job(session, base_url, response, timeout, poll_status=False):
+    """
+    Sigue un 202 con X-Job-Id hasta tener el resultado, con el mismo backoff que
+    awaitJob en client.js, para medir la latencia completa y no solo el 202
+    """
+    delay = 0.5
+    while response.status_code == 202:
+        job_url = f"{base_url}/api/jobs/{response.headers['X-Job-Id']}"
+        time.sleep(delay)
+        delay = min(delay * 1.5, 3.0)
+        if poll_status:
+            status = session.get(job_url, timeout=timeout)
+            if status.status_code != 200:
+                return status
+            if status.json()["status"] not in ("done", "failed"):
+                continue
+        response = session.get(job_url + "/result", headers=REQUEST_HEADERS, timeout=timeout)
+    return response
+
+
+def virtual_user(base_url, recorder, stop_at, seed, think_ms, timeout):
+    rng = random.Random(seed)
+    names = [a[0] for a in ACTIONS]
+    weights = [a[1] for a in ACTIONS]
+    builders = {a[0]: a[2] for a in ACTIONS}
+    session = requests.Session()
+    # The stubs only patch requests.get, so Session.request still reaches the local server
+    while time.time() < stop_at:
+        name = rng.choices(names, weights)[0]
+        method, path, body = builders[name](rng)
+        start = time.perf_counter()
+        ok = True
+        try:
+            if isinstance(body, bytes):
+                response = session.request(method, base_url + path, data=body, timeout=timeout,
+                                           headers=dict(REQUEST_HEADERS, **{"Content-Type": "text/csv"}))
+            else:
+                response = session.request(method, base_url + path, json=body, timeout=timeout,
+                                           headers=REQUEST_HEADERS)
+            response = await_job(session, base_url, response, timeout, poll_status=name in STATUS_POLLING)
+            ok = response.status_code < 500
+        except requests.RequestException:
+            ok = False
+        recorder.add(name, time.perf_counter() - start, ok)
+        if think_ms:
+            time.sleep(rng.expovariate(1000.0 / think_ms))
+
+
+def parse_overrides(values, cast):
+    result = {}
+    for item in values or []:
+        name, _, value = item.partition("=")
+        result[name] = cast(value)
+    return result
+
+
+def run(users=20, duration=30.0, think_ms=200.0, latency_scale=1.0, latency=None,
+        failures=None, seed=42, timeout=60.0, aaii_blocked=False):
+    profiles = default_profiles(latency_scale)
+    for name, ms in (latency or {}).items():
+        profile = profiles.setdefault(name, UpstreamProfile())
+        profile.latency_ms = ms
+        profile.jitter_ms = ms * 0.3
+    for name, rate in (failures or {}).items():
+        profiles.setdefault(name, UpstreamProfile()).failure_rate = rate
+
+    fixture_info()  # warm the fixture cache before timing
+    # Background prefetch would add upstream calls outside the measured requests
+    os.environ.setdefault("PREFETCH_ENABLED", "0")
+    reset_upstreams()
+    set_cache(MemoryCache())
+    stubs = Stubs(profiles, seed=seed, aaii_blocked=aaii_blocked)
+
+    import main
+
+    with stubs.install(main):
+        port = _free_port()
+        server, thread = start_server(main.app, port)
+        base_url = f"http://127.0.0.1:{port}"
+        # The portfolio the import action writes to
+        requests.Session().post(base_url + "/api/portfolios", json=_portfolio_payload(), timeout=timeout)
+        recorder = Recorder()
+        start = time.time()
+        stop_at = start + duration
+        try:
+            with ThreadPoolExecutor(max_workers=users) as pool:
+                futures = [
+                    pool.submit(virtual_user, base_url, recorder, stop_at, seed + i, think_ms, timeout)
+                    for i in range(users)
+                ]
+                for f in futures:
+                    f.result()
+        finally:
+            wall_time = time.time() - start
+            server.should_exit = True
+            thread.join(timeout=10)
+
+    report = recorder.report(wall_time)
+    report["upstream_calls"] = stubs.summary()
+    report["config"] = {
+        "users": users, "duration": duration, "think_ms": think_ms,
+        "latency_scale": latency_scale, "latency": latency or {}, "failures": failures or {},
+    }
+    return report
+
+
+def compare(report, baseline, tolerance):
+    """Devuelve la lista de regresiones frente a un informe anterior"""
+    regressions = []
+    if report["throughput_rps"] < baseline["throughput_rps"] * (1 - tolerance):
+        regressions.append(
+            f"throughput {report['throughput_rps']} rps < baseline {baseline['throughput_rps']} rps")
+    for key in ("p50_ms", "p95_ms", "p99_ms"):
+        if report[key] > baseline[key] * (1 + tolerance):
+            regressions.append(f"{key} {report[key]} > baseline {baseline[key]}")
+    return regressions
+
+
+def print_report(report):
+    print(f"\n{'endpoint':<42}{'count':>7}{'err':>6}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for name, row in report["endpoints"].items():
+        print(f"{name:<42}{row['count']:>7}{row['errors']:>6}"
+              f"{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}")
+    print(f"\nrequests={report['requests']} errors={report['errors']} "
+          f"throughput={report['throughput_rps']} rps "
+          f"p50={report['p50_ms']}ms p95={report['p95_ms']}ms p99={report['p99_ms']}ms")
+    print(f"upstream calls: {json.dumps(report['upstream_calls'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark for the BolsaIA API")
+    parser.add_argument("--users", type=int, default=20, help="concurrent dashboard users")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run")
+    parser.add_argument("--think-ms", type=float, default=200.0, help="mean pause between requests per user")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplier for default upstream latencies")
+    parser.add_argument("--latency", action="append", metavar="UPSTREAM=MS", help="override upstream latency")
+    parser.add_argument("--fail", action="append", metavar="UPSTREAM=RATE", help="inject upstream failure rate")
+    parser.add_argument("--aaii-blocked", action="store_true", help="serve the Incapsula block page for AAII")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="compare against a previous JSON report")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args(argv)
+
+    report = run(
+        users=args.users, duration=args.duration, think_ms=args.think_ms,
+        latency_scale=args.latency_scale, latency=parse_overrides(args.latency, float),
+        failures=parse_overrides(args.fail, float), seed=args.seed, aaii_blocked=args.aaii_blocked,
+    )
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print("\nNo regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,299 @@
+"""
+Sustitutos locales de los servicios externos (yfinance, Yahoo search, Finviz, CNN,
+AAII, Gemini, GoogleTranslator) servidos desde las grabaciones de bench/fixtures.
+
+Cada upstream tiene un perfil con latencia simulada y tasa de fallos, de forma que
+el benchmark (y los tests de resiliencia) funcionan sin red.
+"""
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import ExitStack, contextmanager
+from functools import lru_cache
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import requests
+import yfinance as yf
+from yfinance.exceptions import YFTickerMissingError
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Trading days per yfinance period string
+PERIOD_DAYS = {
+    "1d": 1, "5d": 5, "1mo": 22, "3mo": 66, "6mo": 130, "ytd": 210,
+    "1y": 252, "2y": 504, "5y": 1260, "10y": 2520,
+}
+MAX_HISTORY_DAYS = 10000  # ~40 years of daily bars, like 'max' on an old listing
+
+
+class UpstreamError(Exception):
+    """Fallo inyectado en un upstream simulado"""
+
+
+class UpstreamProfile:
+    """Latencia (ms) y tasa de fallos de un upstream simulado"""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, failure_rate=0.0, status_code=429):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.status_code = status_code
+        self.calls = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def hit(self, rng):
+        """Aplica la latencia y devuelve True si esta llamada debe fallar"""
+        delay = self.latency_ms + (rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+        failed = rng.random() < self.failure_rate
+        with self._lock:
+            self.calls += 1
+            if failed:
+                self.failures += 1
+        return failed
+
+
+# Latencias típicas observadas desde Render
+DEFAULT_PROFILES = {
+    "yfinance": (120, 40),
+    "yahoo_search": (90, 30),
+    "finviz": (250, 80),
+    "cnn": (150, 50),
+    "aaii": (200, 60),
+    "gemini": (1500, 400),
+    "translator": (60, 20),
+}
+
+
+def default_profiles(scale=1.0):
+    return {
+        name: UpstreamProfile(latency * scale, jitter * scale)
+        for name, (latency, jitter) in DEFAULT_PROFILES.items()
+    }
+
+
+def _load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), "rb") as f:
+        return f.read()
+
+
+@lru_cache(maxsize=None)
+def fixture_info():
+    return json.loads(_load_fixture("yfinance_info.json"))
+
+
+def _symbol_info(symbol):
+    info = fixture_info().get(symbol.upper())
+    if info is None:
+        # What yfinance raises for an unknown symbol
+        raise YFTickerMissingError(symbol, "no fixture recorded")
+    return info
+
+
+@lru_cache(maxsize=64)
+def _full_history(symbol):
+    """Serie diaria determinista que termina en el último precio grabado"""
+    info = _symbol_info(symbol)
+    rng = np.random.default_rng(zlib.crc32(symbol.encode()))
+    tz = info.get("exchangeTimezoneName", "America/New_York")
+    end = pd.Timestamp("2024-10-25")
+    index = pd.bdate_range(end=end, periods=MAX_HISTORY_DAYS).tz_localize(tz)
+
+    returns = rng.normal(0.0003, 0.015, MAX_HISTORY_DAYS)
+    close = np.exp(np.cumsum(returns[::-1]))[::-1]
+    close = close / close[-1] * info["regularMarketPrice"]
+    spread = np.abs(rng.normal(0, 0.008, MAX_HISTORY_DAYS))
+    frame = pd.DataFrame(
+        {
+            "Open": close * (1 + rng.normal(0, 0.004, MAX_HISTORY_DAYS)),
+            "High": close * (1 + spread),
+            "Low": close * (1 - spread),
+            "Close": close,
+            "Volume": rng.integers(1_000_000, 50_000_000, MAX_HISTORY_DAYS),
+            "Dividends": 0.0,
+            "Stock Splits": 0.0,
+        },
+        index=index,
+    )
+    frame.index.name = "Date"
+
+    rate = info.get("dividendRate")
+    if rate:
+        # Quarterly payments in Feb/May/Aug/Nov
+        pay_days = frame.index[(frame.index.month % 3 == 2) & (frame.index.day <= 7)]
+        first_of_month = pay_days.to_series().groupby([pay_days.year, pay_days.month]).head(1).index
+        frame.loc[first_of_month, "Dividends"] = round(rate / 4, 4)
+    return frame
+
+
+class FakeFastInfo:
+    def __init__(self, info):
+        self.last_price = info["regularMarketPrice"]
+        self.previous_close = info.get("previousClose")
+        self.currency = info.get("currency")
+
+
+class FakeTicker:
+    """Sustituto de yf.Ticker respaldado por las grabaciones"""
+
+    def __init__(self, symbol, stubs):
+        self.ticker = symbol.upper()
+        self._stubs = stubs
+
+    def _call(self):
+        self._stubs.call("yfinance")
+
+    @property
+    def info(self):
+        self._call()
+        return dict(_symbol_info(self.ticker))
+
+    @property
+    def fast_info(self):
+        self._call()
+        return FakeFastInfo(_symbol_info(self.ticker))
+
+    @property
+    def dividends(self):
+        self._call()
+        divs = _full_history(self.ticker)["Dividends"]
+        return divs[divs > 0]
+
+    def history(self, period="1mo", interval="1d", start=None, end=None, **kwargs):
+        self._call()
+        frame = _full_history(self.ticker)
+        if start or end:
+            tz = frame.index.tz
+            lo = pd.Timestamp(start).tz_localize(tz) if start else frame.index[0]
+            hi = pd.Timestamp(end).tz_localize(tz) if end else frame.index[-1] + pd.Timedelta(days=1)
+            return frame[(frame.index >= lo) & (frame.index < hi)].copy()
+        if period == "max":
+            return frame.copy()
+        return frame.iloc[-PERIOD_DAYS.get(period, 22):].copy()
+
+
+class FakeTickers:
+    def __init__(self, tickers, stubs):
+        symbols = tickers.split() if isinstance(tickers, str) else list(tickers)
+        self.tickers = {s.upper(): FakeTicker(s, stubs) for s in symbols}
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, content=b""):
+        self.status_code = status_code
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error")
+
+
+class FakeTranslator:
+    def __init__(self, stubs):
+        self._stubs = stubs
+
+    def translate(self, text):
+        self._stubs.call("translator")
+        return text
+
+
+class FakeGenerativeModel:
+    def __init__(self, stubs):
+        self._stubs = stubs
+
+    def generate_content(self, prompt):
+        self._stubs.call("gemini")
+        payload = {
+            "score": 0.35, "label": "Bullish", "confidence": 0.7,
+            "summary": "Resumen simulado para el benchmark.", "recommendation": "Mantener",
+        }
+        return mock.Mock(text=json.dumps(payload))
+
+
+class Stubs:
+    """
+    Conjunto de upstreams simulados. `install()` sustituye las dependencias de red de
+    main.py y scraper.py mientras dura el contexto.
+    """
+
+    def __init__(self, profiles=None, seed=0, aaii_blocked=False):
+        self.profiles = profiles if profiles is not None else default_profiles()
+        self.aaii_blocked = aaii_blocked
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def profile(self, upstream):
+        if upstream not in self.profiles:
+            self.profiles[upstream] = UpstreamProfile()
+        return self.profiles[upstream]
+
+    def _should_fail(self, upstream):
+        with self._rng_lock:
+            rng = random.Random(self._rng.random())
+        return self.profile(upstream).hit(rng)
+
+    def call(self, upstream):
+        """Simula una llamada Python (yfinance, Gemini...) que lanza excepción al fallar"""
+        if self._should_fail(upstream):
+            raise UpstreamError(f"{upstream} unavailable (injected)")
+
+    def http_get(self, url, headers=None, timeout=None, **kwargs):
+        """Sustituto de requests.get enrutado por host"""
+        if "finance.yahoo.com/v1/finance/search" in url:
+            upstream, body = "yahoo_search", _load_fixture("yahoo_search.json")
+        elif "finviz.com" in url:
+            symbol = url.split("t=")[1].split("&")[0].upper()
+            raw = _load_fixture("finviz_news.html").decode("utf-8")
+            upstream = "finviz"
+            body = raw.replace("{symbol}", symbol).replace("{s}", symbol).encode("utf-8")
+        elif "dataviz.cnn.io" in url:
+            upstream, body = "cnn", _load_fixture("cnn_fear_and_greed.json")
+        elif "aaii.com" in url:
+            name = "aaii_blocked.html" if self.aaii_blocked else "aaii_sentiment.html"
+            upstream, body = "aaii", _load_fixture(name)
+        else:
+            raise requests.ConnectionError(f"No stub for {url}")
+
+        profile = self.profile(upstream)
+        if self._should_fail(upstream):
+            return FakeResponse(profile.status_code, b"Too Many Requests")
+        return FakeResponse(200, body)
+
+    def summary(self):
+        return {
+            name: {"calls": p.calls, "failures": p.failures}
+            for name, p in self.profiles.items() if p.calls
+        }
+
+    @contextmanager
+    def install(self, main_module=None):
+        """Parchea yfinance, requests y los clientes globales de main.py"""
+        with ExitStack() as stack:
+            stack.enter_context(mock.patch.object(yf, "Ticker", lambda s, *a, **k: FakeTicker(s, self)))
+            stack.enter_context(mock.patch.object(yf, "Tickers", lambda s, *a, **k: FakeTickers(s, self)))
+            stack.enter_context(mock.patch.object(requests, "get", self.http_get))
+            if main_module is not None:
+                tmp_dir = stack.enter_context(tempfile.TemporaryDirectory())
+                stack.enter_context(mock.patch.object(main_module, "translator", FakeTranslator(self)))
+                stack.enter_context(mock.patch.object(main_module, "supabase", None))
+                stack.enter_context(mock.patch.object(main_module, "GEN_API_KEY", "bench"))
+                stack.enter_context(mock.patch.object(
+                    main_module.genai, "GenerativeModel", lambda *a, **k: FakeGenerativeModel(self)))
+                stack.enter_context(mock.patch.object(
+                    main_module, "PORTFOLIO_FILE", os.path.join(tmp_dir, "portfolios.json")))
+            yield self
@@ -0,0 +1,437 @@
+"""
+Caché compartida y locks entre workers para quotes, barras, noticias, sentimiento y traducciones.
+
+Backends (variable CACHE_BACKEND):
+  - memory: diccionario en proceso (un solo worker, por defecto en local), limitado por el
+            tamaño estimado de los valores (CACHE_MAX_MB, 200 por defecto)
+  - sqlite: fichero SQLite en modo WAL compartido por todos los workers de la máquina,
+            limitado por los bytes serializados (mismo CACHE_MAX_MB)
+  - redis:  cualquier servidor compatible con Redis (REDIS_URL), compartido entre instancias;
+            el límite de memoria es el del servidor (maxmemory + allkeys-lru)
+
+Si no se indica, se usa redis cuando hay REDIS_URL, sqlite cuando WEB_CONCURRENCY > 1 y
+memory en otro caso. Los valores se serializan con pickle: la caché solo debe ser accesible
+por el propio backend.
+
+`get_or_load()` añade single-flight: si varios workers piden la misma clave caducada,
+solo uno llama al upstream y el resto espera y lee su resultado.
+"""
+import os
+import pickle
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from observability import CACHE_BYTES, CACHE_EVICTIONS, get_logger, record_cache
+
+log = get_logger("cache")
+
+
+class CacheBackend:
+    """Interfaz común. get() devuelve (valor, encontrado) para poder cachear None"""
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def acquire_lock(self, key, ttl):
+        """Intenta tomar el lock sin bloquear. Devuelve un token o None"""
+        raise NotImplementedError
+
+    def release_lock(self, key, token):
+        raise NotImplementedError
+
+    @contextmanager
+    def lock(self, key, timeout=10.0, ttl=30.0, poll=0.05):
+        """
+        Lock distribuido con caducidad (ttl) para que un worker caído no lo deje bloqueado.
+        Cede True si se adquirió o False si se agotó el timeout.
+        """
+        deadline = time.monotonic() + timeout
+        token = self.acquire_lock(key, ttl)
+        while token is None and time.monotonic() < deadline:
+            time.sleep(poll)
+            token = self.acquire_lock(key, ttl)
+        try:
+            yield token is not None
+        finally:
+            if token is not None:
+                self.release_lock(key, token)
+
+
+# Arrays and frames are counted once even if several entries share them (fresh value,
+# last good copy and job result usually point to the same DataFrame)
+SHARED_TYPES = (np.ndarray, pd.DataFrame, pd.Series, pd.Index)
+
+
+def measure(value, shared, depth=0):
+    """
+    Bytes aproximados de un valor. Los arrays y DataFrames se añaden a `shared`
+    (id -> (objeto, bytes)) en vez de sumarse, para contarlos una sola vez.
+    """
+    if isinstance(value, SHARED_TYPES):
+        if id(value) not in shared:
+            if isinstance(value, pd.DataFrame):
+                size = int(value.memory_usage(index=True, deep=True).sum())
+            elif isinstance(value, (pd.Series, pd.Index)):
+                size = int(value.memory_usage(deep=True))
+            else:
+                size = value.nbytes
+            shared[id(value)] = (value, size)
+        return 0
+    size = sys.getsizeof(value)
+    if depth > 4:
+        return size
+    if isinstance(value, dict):
+        size += sum(measure(k, shared, depth + 1) + measure(v, shared, depth + 1) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(measure(item, shared, depth + 1) for item in value)
+    return size
+
+
+class MemoryCache(CacheBackend):
+    """
+    Caché en proceso con caducidad y LRU por tamaño estimado (max_bytes, CACHE_MAX_MB) y
+    por número de entradas. Las evicciones se cuentan en bolsaia_cache_evictions_total.
+    """
+
+    def __init__(self, max_entries=20000, max_bytes=None):
+        self.max_entries = max_entries
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv("CACHE_MAX_MB", "200")) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._data = OrderedDict()  # key -> (value, expires_at, own bytes, shared ids)
+        self._shared = {}  # id -> [object, bytes, references]
+        self._locks = {}  # key -> (token, expires_at)
+        self._mutex = threading.Lock()
+
+    def get(self, key):
+        with self._mutex:
+            entry = self._data.get(key)
+            if entry is None:
+                return None, False
+            value, expires_at, _, _ = entry
+            if expires_at is not None and expires_at <= time.time():
+                self._remove(key)
+                return None, False
+            self._data.move_to_end(key)
+            return value, True
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        shared = {}
+        own = measure(value, shared)
+        with self._mutex:
+            self._remove(key)
+            added = own + sum(size for obj_id, (_, size) in shared.items() if obj_id not in self._shared)
+            if added > self.max_bytes:
+                # Storing it would flush everything else
+                CACHE_EVICTIONS.labels(key.split(":", 1)[0], "too_large").inc()
+                CACHE_BYTES.set(self.total_bytes)
+                return
+            for obj_id, (obj, size) in shared.items():
+                entry = self._shared.get(obj_id)
+                if entry is None:
+                    self._shared[obj_id] = [obj, size, 1]
+                    self.total_bytes += size
+                else:
+                    entry[2] += 1
+            self._data[key] = (value, expires_at, own, tuple(shared))
+            self.total_bytes += own
+
+            while len(self._data) > self.max_entries:
+                self._evict("entries")
+            while self.total_bytes > self.max_bytes:
+                self._evict("budget")
+            CACHE_BYTES.set(self.total_bytes)
+
+    def delete(self, key):
+        with self._mutex:
+            self._remove(key)
+            CACHE_BYTES.set(self.total_bytes)
+
+    def _evict(self, reason):
+        key = next(iter(self._data))
+        CACHE_EVICTIONS.labels(key.split(":", 1)[0], reason).inc()
+        self._remove(key)
+
+    def _remove(self, key):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return
+        _, _, own, shared_ids = entry
+        self.total_bytes -= own
+        for obj_id in shared_ids:
+            shared = self._shared[obj_id]
+            shared[2] -= 1
+            if shared[2] == 0:
+                del self._shared[obj_id]
+                self.total_bytes -= shared[1]
+
+    def acquire_lock(self, key, ttl):
+        now = time.time()
+        with self._mutex:
+            current = self._locks.get(key)
+            if current is not None and current[1] > now:
+                return None
+            token = uuid.uuid4().hex
+            self._locks[key] = (token, now + ttl)
+            return token
+
+    def release_lock(self, key, token):
+        with self._mutex:
+            current = self._locks.get(key)
+            if current is not None and current[0] == token:
+                del self._locks[key]
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Caché en un fichero SQLite en modo WAL: lecturas concurrentes sin bloquear y
+    escrituras serializadas por SQLite. Sirve para varios workers en la misma máquina.
+
+    Cada fila guarda el tamaño del valor serializado. En la purga periódica, si la suma pasa
+    de max_bytes (CACHE_MAX_MB) se borran las filas escritas hace más tiempo (orden de rowid:
+    un INSERT OR REPLACE la mueve al final). Leer no escribe, así que es FIFO y no LRU.
+    """
+
+    PURGE_INTERVAL = 30
+
+    def __init__(self, path, max_bytes=None):
+        self.path = path
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv("CACHE_MAX_MB", "200")) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._last_purge = 0.0
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires_at REAL, size INTEGER)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, token TEXT, expires_at REAL)")
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(cache)")]
+            if "size" not in columns:
+                # Cache files created before the size budget
+                conn.execute("ALTER TABLE cache ADD COLUMN size INTEGER")
+                conn.execute("UPDATE cache SET size = length(value)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None, False
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            return None, False
+        return pickle.loads(value), True
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        raw = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        conn = self._conn()
+        if len(raw) > self.max_bytes:
+            # Storing it would flush everything else
+            CACHE_EVICTIONS.labels(key.split(":", 1)[0], "too_large").inc()
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            return
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at, size) VALUES (?, ?, ?, ?)",
+            (key, raw, expires_at, len(raw)))
+        self._maybe_purge(conn)
+
+    def _maybe_purge(self, conn):
+        # Expired rows are ignored on read: delete them, and the oldest rows over the budget,
+        # every PURGE_INTERVAL seconds (per worker) to keep the file bounded
+        now = time.time()
+        if now - self._last_purge > self.PURGE_INTERVAL:
+            self._last_purge = now
+            self.purge(now)
+
+    def purge(self, now=None):
+        conn = self._conn()
+        conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now or time.time(),))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        excess = total - self.max_bytes
+        if excess > 0:
+            last_rowid = None
+            for rowid, key, size in conn.execute("SELECT rowid, key, size FROM cache ORDER BY rowid"):
+                CACHE_EVICTIONS.labels(key.split(":", 1)[0], "budget").inc()
+                last_rowid = rowid
+                total -= size
+                excess -= size
+                if excess <= 0:
+                    break
+            conn.execute("DELETE FROM cache WHERE rowid <= ?", (last_rowid,))
+        CACHE_BYTES.set(total)
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def acquire_lock(self, key, ttl):
+        now = time.time()
+        token = uuid.uuid4().hex
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM locks WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO locks (key, token, expires_at) VALUES (?, ?, ?)", (key, token, now + ttl))
+            conn.execute("COMMIT")
+        except sqlite3.OperationalError as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            log.warning("SQLite lock error", extra={"key": key, "error": str(e)})
+            return None
+        return token if cursor.rowcount == 1 else None
+
+    def release_lock(self, key, token):
+        self._conn().execute("DELETE FROM locks WHERE key = ? AND token = ?", (key, token))
+
+
+class RedisCache(CacheBackend):
+    """Caché en Redis (o compatible: Valkey, KeyDB, Upstash...)"""
+
+    # Delete the lock only if we still own it
+    RELEASE_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('del', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, url, prefix="bolsaia:"):
+        import redis
+
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url)
+        self._release = self.client.register_script(self.RELEASE_SCRIPT)
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return None, False
+        return pickle.loads(raw), True
+
+    def set(self, key, value, ttl=None):
+        raw = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if ttl:
+            self.client.set(self.prefix + key, raw, px=int(ttl * 1000))
+        else:
+            self.client.set(self.prefix + key, raw)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def acquire_lock(self, key, ttl):
+        token = uuid.uuid4().hex
+        if self.client.set(self.prefix + "lock:" + key, token, nx=True, px=int(ttl * 1000)):
+            return token
+        return None
+
+    def release_lock(self, key, token):
+        self._release(keys=[self.prefix + "lock:" + key], args=[token])
+
+
+def create_cache(backend=None):
+    backend = (backend or os.getenv("CACHE_BACKEND") or "").lower()
+    if not backend:
+        if os.getenv("REDIS_URL"):
+            backend = "redis"
+        elif int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+            backend = "sqlite"
+        else:
+            backend = "memory"
+
+    if backend == "redis":
+        return RedisCache(os.environ["REDIS_URL"])
+    if backend == "sqlite":
+        path = os.getenv("CACHE_SQLITE_PATH") or os.path.join(tempfile.gettempdir(), "bolsaia-cache.sqlite3")
+        return SQLiteCache(path)
+    return MemoryCache()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            try:
+                _cache = create_cache()
+            except Exception as e:
+                log.error("Cache backend unavailable, using memory", extra={"error": str(e)})
+                _cache = MemoryCache()
+            log.info("Cache backend ready", extra={"backend": type(_cache).__name__})
+        return _cache
+
+
+def set_cache(cache):
+    """Sustituye la caché global (tests y benchmarks)"""
+    global _cache
+    with _cache_lock:
+        _cache = cache
+
+
+def get_or_load(namespace, key, ttl, loader, lock_timeout=10.0):
+    """
+    Devuelve el valor cacheado o lo carga con loader() una sola vez entre todos los
+    workers. loader() devuelve (valor, cacheable): los valores stale no se cachean.
+    Devuelve (valor, desde_cache).
+    """
+    cache = get_cache()
+    full_key = f"{namespace}:{key}"
+    value, found = cache.get(full_key)
+    record_cache(namespace, found)
+    if found:
+        return value, True
+
+    with cache.lock(full_key, timeout=lock_timeout) as acquired:
+        if acquired:
+            # Another worker may have refreshed it while we were waiting
+            value, found = cache.get(full_key)
+            if found:
+                return value, True
+        value, cacheable = loader()
+        if cacheable:
+            cache.set(full_key, value, ttl)
+        return value, False
+
+
+class CacheStore:
+    """Adaptador de la caché para guardar los últimos valores buenos de resilience.Upstream"""
+
+    def __init__(self, prefix, retention):
+        self.prefix = prefix
+        self.retention = retention
+
+    def get(self, key):
+        return get_cache().get(self.prefix + key)
+
+    def set(self, key, value):
+        get_cache().set(self.prefix + key, value, self.retention)
@@ -0,0 +1,51 @@
+"""
+Compactación de DataFrames de yfinance antes de guardarlos en la caché.
+
+yfinance devuelve float64 con columnas que no usamos (Dividends, Stock Splits...) y un
+índice con zona horaria. Para los gráficos basta con:
+  - las columnas que se pintan,
+  - precios en float32 (7 cifras significativas),
+  - enteros (volumen) en uint32 cuando caben,
+  - índice datetime64[ns] sin zona horaria, es decir int64 epoch en ns.
+Con eso una barra diaria ocupa 28 bytes en vez de 64.
+
+Al volver a JSON, `widen()` pasa los float32 a float64 redondeados a 7 cifras para no
+enviar el ruido de la conversión (185.53 y no 185.52999877929688).
+"""
+import numpy as np
+import pandas as pd
+
+UINT32_MAX = np.iinfo(np.uint32).max
+
+
+def _compact_values(values):
+    if values.dtype.kind == "f":
+        return values.astype(np.float32)
+    if values.dtype.kind in "iu" and len(values) and values.min() >= 0 and values.max() <= UINT32_MAX:
+        return values.astype(np.uint32)
+    return values
+
+
+def compact_frame(df, columns=None):
+    """Copia compacta de df con solo `columns` (todas si es None)"""
+    if columns is not None:
+        df = df[list(columns)]
+    index = df.index
+    if not isinstance(index, pd.DatetimeIndex):
+        # An empty yfinance history comes with a plain Index
+        index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return pd.DataFrame({name: _compact_values(df[name].to_numpy()) for name in df.columns}, index=index)
+
+
+def widen(values):
+    """float32 -> float64 con 7 cifras significativas. Otros tipos se devuelven tal cual"""
+    values = np.asarray(values)
+    if values.dtype != np.float32:
+        return values
+    wide = values.astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        magnitude = np.floor(np.log10(np.abs(wide)))
+    scale = 10.0 ** (6 - np.where(np.isfinite(magnitude), magnitude, 0))
+    return np.round(wide * scale) / scale
@@ -0,0 +1,360 @@
+"""
+Importación de extractos de bróker (CSV) a una cartera.
+
+Formatos:
+  - DEGIRO: exportación de "Transacciones" (inglés o español)
+  - IBKR: sección "Trades" del Activity Statement
+  - genérico: cabecera con columnas tipo date/symbol/isin/quantity/price/fees
+
+El fichero se lee fila a fila dos veces (está en un fichero temporal):
+  1. se recogen los ISIN/tickers distintos y, por símbolo, el rango de fechas sin precio,
+  2. se resuelven en bloque (un search por identificador, cacheado) y se pide un único
+     histórico por símbolo para los precios que faltan (as-of: último cierre <= fecha),
+  3. se vuelve a leer el fichero generando las operaciones.
+En memoria solo quedan los identificadores distintos, los cierres de cada símbolo y las
+operaciones ya creadas; el guardado es una sola escritura de las carteras.
+"""
+import csv
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import yfinance as yf
+
+from observability import get_logger
+from resilience import upstream
+
+log = get_logger("importer")
+
+MAX_REPORTED_ISSUES = 100
+RESOLVE_WORKERS = 4
+
+# Column aliases (lower case) for each holding field
+COLUMNS = {
+    "date": ("date", "fecha", "tradedate", "trade date", "date/time", "fecha/hora"),
+    "isin": ("isin",),
+    "symbol": ("symbol", "ticker", "símbolo", "simbolo"),
+    "name": ("product", "producto", "description", "descripción", "name"),
+    "exchange": ("reference exchange", "bolsa de referencia", "exchange", "listingexchange"),
+    "shares": ("quantity", "número", "numero", "cantidad", "shares"),
+    "price": ("price", "precio", "t. price", "tradeprice", "trade price"),
+    "fees": ("transaction and/or third party fees", "costes de transacción y/o externos",
+             "transaction costs", "comm/fee", "ibcommission", "commission", "fees", "comisión"),
+    "category": ("asset category", "assetclass", "asset class"),
+}
+
+# Asset categories that are portfolio holdings (IBKR lists ETFs under "Stocks");
+# forex, options, futures... are not
+STOCK_CATEGORIES = {"stocks", "stk", "etf", "etfs"}
+
+# DEGIRO reference exchange -> Yahoo suffix ("" = US listing without suffix)
+DEGIRO_EXCHANGES = {
+    "MAD": "MC", "XET": "DE", "FRA": "F", "MIL": "MI", "EPA": "PA", "EAM": "AS", "EBR": "BR",
+    "ELI": "LS", "ISE": "IR", "WBO": "VI", "WSE": "WA", "LSE": "L", "TOR": "TO", "NSY": "", "NDQ": "",
+    "ASE": "",
+}
+
+DATE_FORMATS = ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%Y%m%d", "%m/%d/%Y")
+
+
+class InvalidStatement(ValueError):
+    """El fichero no tiene un formato reconocible"""
+
+
+def parse_number(text, decimal_comma=False):
+    """'1.234,56' / '1,234.56' / '134,25' -> float. None si está vacío"""
+    # Drop currency symbols and (non-breaking) spaces
+    text = "".join(ch for ch in text or "" if ch.isdigit() or ch in ",.-")
+    if not text or text == "-":
+        return None
+    if "," in text and "." in text:
+        # The last separator is the decimal one
+        if text.rfind(",") > text.rfind("."):
+            text = text.replace(".", "").replace(",", ".")
+        else:
+            text = text.replace(",", "")
+    elif "," in text:
+        # '134,25' is a decimal comma; '1,000' or '1,234,567' are thousands
+        integer, _, decimals = text.rpartition(",")
+        if decimal_comma or (len(decimals) != 3 and "," not in integer):
+            text = f"{integer}.{decimals}"
+        else:
+            text = text.replace(",", "")
+    return float(text)
+
+
+def parse_date(text):
+    text = (text or "").strip().split(",")[0].split(" ")[0].split(";")[0]
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _map_header(header):
+    names = [h.strip().lower() for h in header]
+    mapping = {}
+    for field, aliases in COLUMNS.items():
+        for i, name in enumerate(names):
+            if name in aliases:
+                mapping[field] = i
+                break
+    return mapping
+
+
+def _read_lines(raw):
+    """Líneas de texto de un fichero binario sin cerrarlo (se lee más de una vez)"""
+    raw.seek(0)
+    text = io.TextIOWrapper(raw, encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        # Not `yield from`: closing the generator would close the wrapper and the upload
+        for line in text:
+            yield line
+    finally:
+        text.detach()
+
+
+def iter_trades(raw):
+    """
+    Genera (fila, operación) con operación = dict(date, isin, symbol, name, exchange,
+    shares, price, fees) o None si la fila no es una compra válida.
+    """
+    lines = _read_lines(raw)
+    try:
+        first = next(lines, "")
+        delimiter = ";" if first.count(";") > first.count(",") else ","
+        reader = csv.reader(_chain(first, lines), delimiter=delimiter)
+
+        header = next(reader, None)
+        if not header:
+            raise InvalidStatement("Fichero vacío")
+
+        # IBKR activity statements start with the "Statement" section
+        ibkr = header[0].strip() == "Statement"
+        mapping = None if ibkr else _map_header(header)
+        # Spanish DEGIRO exports use a decimal comma
+        decimal_comma = any(h.strip().lower() == "producto" for h in header)
+        if mapping is not None and ("date" not in mapping or "shares" not in mapping
+                                    or not ({"isin", "symbol"} & set(mapping))):
+            raise InvalidStatement("Cabecera no reconocida: se esperan columnas de fecha, cantidad e ISIN o símbolo")
+
+        for row_number, row in enumerate(reader, start=2):
+            if ibkr:
+                # Activity statements mix sections: only "Trades" order rows are holdings
+                if len(row) < 3 or row[0] != "Trades":
+                    continue
+                if row[1] == "Header":
+                    mapping = _map_header(row)
+                    continue
+                if row[1] != "Data" or row[2] != "Order" or mapping is None:
+                    continue
+            if not _is_stock(row, mapping):
+                continue
+            yield row_number, _to_trade(row, mapping, decimal_comma)
+    finally:
+        # Detach from the upload before it's closed, even if we stopped early
+        lines.close()
+
+
+def _chain(first, lines):
+    yield first
+    yield from lines
+
+
+def _is_stock(row, mapping):
+    i = mapping.get("category")
+    return i is None or i >= len(row) or row[i].strip().lower() in STOCK_CATEGORIES
+
+
+def _to_trade(row, mapping, decimal_comma):
+    def cell(field):
+        i = mapping.get(field)
+        return row[i].strip() if i is not None and i < len(row) else ""
+
+    try:
+        shares = parse_number(cell("shares"), decimal_comma)
+        price = parse_number(cell("price"), decimal_comma)
+        fees = parse_number(cell("fees"), decimal_comma)
+    except ValueError:
+        return None
+    day = parse_date(cell("date"))
+    if day is None or not shares or shares < 0:
+        # Sells (negative quantity) are not holdings
+        return None
+    isin, symbol = cell("isin").upper(), cell("symbol").upper()
+    if not isin and not symbol:
+        # Nothing to resolve: don't let it reach search("")
+        return None
+    return {
+        "date": day,
+        "isin": isin,
+        "symbol": symbol,
+        "name": cell("name"),
+        "exchange": cell("exchange").upper(),
+        "shares": shares,
+        "price": price if price and price > 0 else None,
+        "fees": abs(fees) if fees else 0.0,
+    }
+
+
+def identifier(trade):
+    """Clave de resolución: ISIN (+ bolsa de DEGIRO) o ticker"""
+    if trade["isin"]:
+        return (trade["isin"], trade["exchange"])
+    return (trade["symbol"], "")
+
+
+def is_isin(text):
+    return len(text) == 12 and text[:2].isalpha() and text.isalnum() and text[-1].isdigit()
+
+
+def pick_listing(results, query, exchange):
+    """
+    Elige entre los resultados del search el que cotiza en la bolsa indicada.
+    Un ISIN identifica el valor, así que vale cualquier cotización; un ticker solo se
+    acepta si coincide (con o sin sufijo de bolsa): el search devuelve también parecidos.
+    """
+    if not results:
+        return None
+    symbols = [r["symbol"].upper() for r in results]
+    if query in symbols:
+        return query
+    suffix = DEGIRO_EXCHANGES.get(exchange)
+    if suffix is not None:
+        for symbol in symbols:
+            symbol_suffix = symbol.rsplit(".", 1)[1] if "." in symbol else ""
+            if symbol_suffix == suffix:
+                return symbol
+    if is_isin(query):
+        return symbols[0]
+    for symbol in symbols:
+        if symbol.rsplit(".", 1)[0] == query:
+            return symbol
+    return None
+
+
+def resolve_identifiers(keys, search, known=None):
+    """{(isin|ticker, bolsa): símbolo Yahoo}. known: ISIN -> símbolo de las carteras actuales"""
+    known = known or {}
+    resolved = {}
+    pending = []
+    for key in keys:
+        if key[0] in known:
+            resolved[key] = known[key[0]]
+        else:
+            pending.append(key)
+
+    def resolve(key):
+        query, exchange = key
+        try:
+            return key, pick_listing(search(query), query, exchange)
+        except Exception as e:
+            log.warning("Could not resolve identifier", extra={"query": query, "error": str(e)})
+            return key, None
+
+    with ThreadPoolExecutor(max_workers=RESOLVE_WORKERS) as pool:
+        for key, symbol in pool.map(resolve, pending):
+            resolved[key] = symbol
+    return resolved
+
+
+def _fetch_closes(symbol, start, end):
+    history = yf.Ticker(symbol).history(start=start.isoformat(), end=end.isoformat(), interval="1d")
+    if history.empty:
+        return np.array([], dtype="datetime64[D]"), np.array([])
+    days = history.index.tz_localize(None).values.astype("datetime64[D]")
+    return days, history["Close"].to_numpy()
+
+
+def fetch_closes(ranges):
+    """Un histórico por símbolo: {símbolo: (días, cierres)} para los rangos {símbolo: (min, max)}"""
+    closes = {}
+    for symbol, (first, last) in ranges.items():
+        try:
+            # A few days before the first date so weekends/holidays find the previous close
+            closes[symbol], _ = upstream("yfinance").call(
+                None, _fetch_closes, symbol, first - timedelta(days=7), last + timedelta(days=1),
+                operation="history")
+        except Exception as e:
+            log.warning("Could not fetch closes", extra={"symbol": symbol, "error": str(e)})
+    return closes
+
+
+def close_as_of(closes, day):
+    days, values = closes
+    i = np.searchsorted(days, np.datetime64(day, "D"), side="right") - 1
+    return float(values[i]) if i >= 0 else None
+
+
+def import_holdings(raw, search, known=None):
+    """
+    Lee el CSV (fichero binario con seek) y devuelve (operaciones, informe).
+    search(query) -> resultados de /api/search.
+    """
+    keys = set()
+    ranges = {}  # identifier -> (first, last) date without price
+    for _, trade in iter_trades(raw):
+        if trade is None:
+            continue
+        key = identifier(trade)
+        keys.add(key)
+        if trade["price"] is None:
+            first, last = ranges.get(key, (trade["date"], trade["date"]))
+            ranges[key] = (min(first, trade["date"]), max(last, trade["date"]))
+
+    resolved = resolve_identifiers(keys, search, known)
+
+    symbol_ranges = {}
+    for key, (first, last) in ranges.items():
+        symbol = resolved.get(key)
+        if symbol:
+            current = symbol_ranges.get(symbol, (first, last))
+            symbol_ranges[symbol] = (min(current[0], first), max(current[1], last))
+    closes = fetch_closes(symbol_ranges)
+
+    holdings = []
+    issues = []
+    skipped = 0
+    id_base = int(time.time() * 1000)
+
+    def skip(row_number, reason):
+        nonlocal skipped
+        skipped += 1
+        if len(issues) < MAX_REPORTED_ISSUES:
+            issues.append({"row": row_number, "reason": reason})
+
+    for row_number, trade in iter_trades(raw):
+        if trade is None:
+            skip(row_number, "Fila sin compra válida (fecha, cantidad positiva, ISIN o símbolo)")
+            continue
+        symbol = resolved.get(identifier(trade))
+        if not symbol:
+            skip(row_number, f"No se encontró el símbolo de {trade['isin'] or trade['symbol']}")
+            continue
+        price = trade["price"]
+        if price is None and symbol in closes:
+            price = close_as_of(closes[symbol], trade["date"])
+        if price is None:
+            skip(row_number, f"Sin precio para {symbol} el {trade['date'].isoformat()}")
+            continue
+        holdings.append({
+            "id": f"{id_base}-{len(holdings)}",
+            "symbol": symbol,
+            "isin": trade["isin"],
+            "date": trade["date"].isoformat(),
+            "shares": trade["shares"],
+            "price": round(price, 4),
+            "fees": trade["fees"],
+        })
+
+    report = {
+        "imported": len(holdings),
+        "skipped": skipped,
+        "issues": issues,
+        "symbols": len({h["symbol"] for h in holdings}),
+    }
+    return holdings, report
@@ -0,0 +1,229 @@
+"""
+Cola de trabajos en segundo plano para el análisis lento (sentimiento con Gemini, noticias
+traducidas, gráficos 'max') y el prefetch.
+
+  - un pool fijo de workers limita cuánto trabajo caro se hace a la vez (JOB_WORKERS),
+  - la cola es por prioridad: las peticiones de usuario (INTERACTIVE) pasan antes que el
+    prefetch (PREFETCH), y el prefetch solo puede ocupar parte de la cola,
+  - los trabajos se deduplican por clave: pedir "news:AAPL" mientras ya está en cola o en
+    marcha devuelve el mismo trabajo, y uno terminado se reutiliza mientras siga fresco,
+  - el estado y el resultado se guardan en la caché compartida, así que cualquier worker
+    de uvicorn puede responder al polling de un trabajo que se ejecuta en otro.
+
+Las funciones devuelven (valor, cacheable) como los loaders de get_or_load: un resultado
+no cacheable (stale, vacío por fallo del upstream) solo se guarda para quien lo espera.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+import uuid
+
+from cache import get_cache
+from observability import JOB_DURATION, JOBS, JOBS_QUEUED, get_logger
+
+log = get_logger("jobs")
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+INTERACTIVE, PREFETCH = 0, 10
+
+# Records of pending/finished jobs stay this long for polling, even if not reusable
+POLL_TTL = 120
+# A job stuck as queued/running this long (its worker died) is submitted again
+STALLED_TTL = 600
+# Background (prefetch) jobs may only fill this share of the queue: the rest is kept for users
+BACKGROUND_QUEUE_SHARE = 0.5
+
+
+class QueueFull(Exception):
+    """Demasiados trabajos pendientes"""
+
+
+class Job:
+    def __init__(self, kind, key, fn, args, priority, ttl):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.priority = priority
+        self.ttl = ttl
+        self.status = QUEUED
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.cacheable = False
+        self.error = None
+        self.finished = threading.Event()
+
+    def record(self):
+        """Estado serializable que se guarda en la caché compartida"""
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "key": self.key,
+            "status": self.status,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "fresh_until": self.finished_at + self.ttl if self.cacheable and self.finished_at else None,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+def is_reusable(record, now=None):
+    now = now or time.time()
+    if record["status"] in (QUEUED, RUNNING):
+        return now - record["submitted_at"] < STALLED_TTL
+    return record["status"] == DONE and record["fresh_until"] is not None and now < record["fresh_until"]
+
+
+def public(record):
+    """Estado de un trabajo sin el resultado (para /api/jobs/{id})"""
+    return {k: v for k, v in record.items() if k not in ("result", "fresh_until")}
+
+
+class JobQueue:
+    def __init__(self, workers=None, max_queued=None):
+        self.workers = workers or int(os.getenv("JOB_WORKERS", "4"))
+        self.max_queued = max_queued or int(os.getenv("JOB_QUEUE_LIMIT", "200"))
+        self._heap = []  # (priority, seq, job)
+        self._seq = itertools.count()
+        self._local = {}  # key -> pending Job in this process
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._threads = []
+        self._stopping = False
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping = False
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        with self._lock:
+            self._stopping = True
+            self._available.notify_all()
+            self._threads = []
+
+    def submit(self, kind, key, fn, *args, priority=INTERACTIVE, ttl=300):
+        """Encola fn(*args) salvo que ya haya un trabajo vivo o fresco con esa clave. Devuelve su estado"""
+        self.start()
+        cache = get_cache()
+        with self._lock:
+            job = self._local.get(key)
+            if job is not None:
+                if priority < job.priority and job.status == QUEUED:
+                    # Someone is waiting for it now: move it ahead of the prefetch work
+                    job.priority = priority
+                    heapq.heappush(self._heap, (priority, next(self._seq), job))
+                JOBS.labels(kind, "reused").inc()
+                return job.record()
+
+        job_id, found = cache.get(f"jobkey:{key}")
+        if found:
+            record, found = cache.get(f"job:{job_id}")
+            if found and is_reusable(record):
+                JOBS.labels(kind, "reused").inc()
+                return record
+
+        limit = self.max_queued if priority <= INTERACTIVE else int(self.max_queued * BACKGROUND_QUEUE_SHARE)
+        with self._lock:
+            if len(self._heap) >= limit:
+                JOBS.labels(kind, "rejected").inc()
+                raise QueueFull(f"{len(self._heap)} jobs pending")
+            job = Job(kind, key, fn, args, priority, ttl)
+            self._local[key] = job
+        # Saved before a worker can take it, so "queued" never overwrites a later state
+        record = job.record()
+        self._save_record(record, STALLED_TTL)
+        with self._lock:
+            heapq.heappush(self._heap, (job.priority, next(self._seq), job))
+            JOBS_QUEUED.inc()
+            JOBS.labels(kind, "submitted").inc()
+            self._available.notify()
+        return record
+
+    def get(self, job_id):
+        record, found = get_cache().get(f"job:{job_id}")
+        return record if found else None
+
+    def wait(self, record, timeout):
+        """Espera hasta timeout segundos a que termine el trabajo y devuelve su último estado"""
+        if record["status"] in (DONE, FAILED) or timeout <= 0:
+            return record
+        with self._lock:
+            job = self._local.get(record["key"])
+        if job is not None and job.id == record["id"]:
+            job.finished.wait(timeout)
+            return job.record()
+
+        # Running in another worker process: poll the shared cache
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            current = self.get(record["id"])
+            if current is None or current["status"] in (DONE, FAILED):
+                return current or record
+            time.sleep(0.1)
+        return self.get(record["id"]) or record
+
+    def _save(self, job):
+        if job.status in (QUEUED, RUNNING):
+            ttl = STALLED_TTL
+        else:
+            ttl = max(job.ttl if job.cacheable else 0, POLL_TTL)
+        self._save_record(job.record(), ttl)
+
+    def _save_record(self, record, ttl):
+        cache = get_cache()
+        cache.set(f"job:{record['id']}", record, ttl)
+        cache.set(f"jobkey:{record['key']}", record["id"], ttl)
+
+    def _next(self):
+        with self._lock:
+            while True:
+                if self._stopping:
+                    return None
+                while self._heap:
+                    priority, _, job = heapq.heappop(self._heap)
+                    # Skip the old entry of a job whose priority was raised, or already taken
+                    if job.status == QUEUED and priority == job.priority:
+                        job.status = RUNNING
+                        JOBS_QUEUED.dec()
+                        return job
+                self._available.wait()
+
+    def _work(self):
+        while True:
+            job = self._next()
+            if job is None:
+                return
+            job.started_at = time.time()
+            JOB_DURATION.labels(job.kind, "wait").observe(job.started_at - job.submitted_at)
+            self._save(job)
+            try:
+                job.result, job.cacheable = job.fn(*job.args)
+                job.status = DONE
+            except Exception as e:
+                job.status = FAILED
+                job.error = str(e)
+                log.warning("Job failed", extra={"kind": job.kind, "key": job.key, "error": str(e)})
+            job.finished_at = time.time()
+            JOB_DURATION.labels(job.kind, "run").observe(job.finished_at - job.started_at)
+            JOBS.labels(job.kind, job.status).inc()
+            self._save(job)
+            with self._lock:
+                if self._local.get(job.key) is job:
+                    del self._local[job.key]
+            job.finished.set()
+
+
+jobs = JobQueue()
@@ -1,19 +1,43 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import yfinance as yf
 import pandas as pd
+import numpy as np
 import json
 import requests
 from deep_translator import GoogleTranslator
 import os
+import tempfile
 from dotenv import load_dotenv
 import google.generativeai as genai
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 from typing import List
+from datetime import datetime
 
 
 from supabase import create_client, Client
 
+from cache import get_cache, get_or_load
+from frames import compact_frame, widen
+from importer import InvalidStatement, import_holdings
+from jobs import DONE, FAILED, QueueFull, jobs, public
+from market_hours import market_ttl, session_ttl
+from observability import MetricsMiddleware, get_logger, metrics_response, span
+from prefetch import PrefetchScheduler, portfolio_symbols, registry
+from resilience import (
+    EmptyResponse, NoData, UpstreamUnavailable, cached_call, is_client_error, refresh_cached, upstream,
+)
+from wire import columnar_response, compression_middleware, frame_columns, negotiate
+
+log = get_logger("api")
+
+# yfinance logs network errors and returns an empty frame instead of raising:
+# let them reach the resilience layer (retries, breaker, stale fallback)
+if hasattr(yf, "config"):
+    yf.config.debug.hide_exceptions = False
+
 # Load .env explicitly from the same directory as main.py
 current_dir = os.path.dirname(os.path.abspath(__file__))
 env_path = os.path.join(current_dir, ".env")
@@ -30,22 +54,19 @@ supabase: Client = None
 if SUPABASE_URL and SUPABASE_KEY:
     try:
         supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        print("Supabase Connected Successfully")
+        log.info("Supabase connected")
     except Exception as e:
-        print(f"Supabase connection error: {e}")
+        log.error("Supabase connection error", extra={"error": str(e)})
 
-print(f"--- BOLSA-IA DEBUG ---")
-print(f"Loading environment from: {env_path}")
+log.info("Loading environment", extra={"env_path": env_path})
 if GEN_API_KEY:
-    print(f"API Key found: {GEN_API_KEY[:5]}... (Oculto)")
     try:
         genai.configure(api_key=GEN_API_KEY)
-        print("Gemini Configured Successfully")
+        log.info("Gemini configured")
     except Exception as e:
-        print(f"Gemini config error: {e}")
+        log.error("Gemini config error", extra={"error": str(e)})
 else:
-    print("WARNING: GEMINI_API_KEY not found in .env")
-print(f"----------------------")
+    log.warning("GEMINI_API_KEY not found in .env")
 
 app = FastAPI(title="BolsaIA API")
 
@@ -56,10 +77,91 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Data-Stale", "X-Job-Id"],
 )
+# Compress JSON responses (brotli when the client supports it, gzip otherwise)
+compression, compression_options = compression_middleware()
+app.add_middleware(compression, **compression_options)
+app.add_middleware(MetricsMiddleware)
 
 translator = GoogleTranslator(source='auto', target='es')
 
+# Tiempo (segundos) que un valor de la caché compartida se considera fresco.
+# La capa de resiliencia guarda aparte una copia de 24h para servirla como stale.
+# Para quotes, barras y precio a fecha es el TTL con el mercado abierto: con el
+# mercado cerrado duran hasta la siguiente apertura (ver market_hours).
+CACHE_TTLS = {
+    "quotes": 30,
+    "quote_info": 300,
+    "bars": 900,
+    "dividends": 12 * 3600,
+    "price_at": 300,  # sesión en curso; una sesión ya cerrada se cachea 30 días
+    "news": 600,
+    "sentiment": 1800,
+    "market_sentiment": 600,
+    "translations": 30 * 24 * 3600,
+    "search": 3600,
+}
+
+
+def stale_headers(stale: bool):
+    return {"X-Data-Stale": "true"} if stale else {}
+
+
+def mark_stale(response: Response, stale: bool):
+    """Las respuestas en forma de lista indican los datos `stale` con una cabecera"""
+    response.headers.update(stale_headers(stale))
+
+
+# Seconds an endpoint waits for its job before answering 202 with the job id, for clients
+# that don't send `Prefer: respond-async` (the frontend does). Each second holds a server thread
+JOB_INLINE_WAIT = float(os.getenv("JOB_INLINE_WAIT", "1"))
+
+def run_job(request: Request, kind, key, fn, *args, wait=None):
+    """
+    Ejecuta un análisis lento en la cola de trabajos y devuelve su estado tras esperar como
+    mucho JOB_INLINE_WAIT segundos (nada con la cabecera `Prefer: respond-async`).
+    Los endpoints sirven de la caché lo que ya está fresco y solo encolan en un fallo, así que
+    un trabajo terminado no se reutiliza (TTL 0): su TTL se sumaría al de los datos.
+    """
+    try:
+        record = jobs.submit(kind, key, fn, *args, ttl=0)
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="Too many pending jobs", headers={"Retry-After": "5"})
+    if wait is None:
+        wait = 0 if "respond-async" in request.headers.get("prefer", "") else JOB_INLINE_WAIT
+    return jobs.wait(record, wait)
+
+def job_accepted(record):
+    """202 con el trabajo en curso: el cliente consulta /api/jobs/{id}/result"""
+    return JSONResponse(public(record), status_code=202, headers={"X-Job-Id": record["id"]})
+
+
+def translate(text):
+    """Traduce al español; si el traductor falla devuelve el texto original"""
+    try:
+        translated, _ = cached_call(
+            "translations", text, CACHE_TTLS["translations"], "translator", translator.translate, text,
+            operation="translate")
+        return translated
+    except Exception as e:
+        log.warning("Translation error", extra={"error": str(e)})
+        return text
+
+
+EUR_SUFFIXES = ['MI', 'PA', 'MC', 'DE', 'AS', 'BR', 'LS', 'VI', 'IR']
+
+def currency_from_suffix(symbol):
+    """Infiere la divisa a partir del sufijo de mercado (SAN.MC -> EUR). None si no hay sufijo conocido"""
+    suffix = symbol.split('.')[-1] if '.' in symbol else ""
+    if suffix in EUR_SUFFIXES:
+        return "EUR"
+    elif suffix == 'L':
+        return "GBP"
+    elif suffix == 'TO':
+        return "CAD"
+    return None
+
 
 # Portfolio Persistence
 PORTFOLIO_FILE = os.path.join(current_dir, "portfolios.json")
@@ -70,11 +172,15 @@ def load_portfolios():
         try:
             # We assume a table named 'bolsa_ia_settings' or just 'portfolios'
             # Here we'll use a simple key-value approach or a dedicated table
-            response = supabase.table("portfolios_v2").select("data").eq("id", "current_portfolio").execute()
+            response, _ = upstream("supabase").call(
+                None,
+                lambda: supabase.table("portfolios_v2").select("data").eq("id", "current_portfolio").execute(),
+                operation="load_portfolios",
+            )
             if response.data:
                 return response.data[0]["data"]
         except Exception as e:
-            print(f"Supabase load error: {e}")
+            log.error("Supabase load error", extra={"error": str(e)})
     
     # 2. Fallback to local file
     if not os.path.exists(PORTFOLIO_FILE):
@@ -83,7 +189,7 @@ def load_portfolios():
         with open(PORTFOLIO_FILE, 'r', encoding='utf-8') as f:
             return json.load(f)
     except Exception as e:
-        print(f"Error loading portfolios from file: {e}")
+        log.error("Error loading portfolios from file", extra={"error": str(e)})
         return []
 
 def save_portfolios_to_db(data):
@@ -93,13 +199,17 @@ def save_portfolios_to_db(data):
         try:
             # Upsert into a table named 'portfolios_v2'
             # id='current_portfolio' is a simple way to store the global state
-            supabase.table("portfolios_v2").upsert({
-                "id": "current_portfolio",
-                "data": data
-            }).execute()
+            upstream("supabase").call(
+                None,
+                lambda: supabase.table("portfolios_v2").upsert({
+                    "id": "current_portfolio",
+                    "data": data
+                }).execute(),
+                operation="save_portfolios",
+            )
             success = True
         except Exception as e:
-            print(f"Supabase save error: {e}")
+            log.error("Supabase save error", extra={"error": str(e)})
     
     # 2. Always backup to local file if possible
     try:
@@ -107,7 +217,7 @@ def save_portfolios_to_db(data):
             json.dump(data, f, ensure_ascii=False, indent=2)
             if not supabase: success = True # If no supabase, local is success
     except Exception as e:
-        print(f"Error saving portfolios local: {e}")
+        log.error("Error saving portfolios local", extra={"error": str(e)})
     
     return success
 
@@ -122,69 +232,129 @@ class PortfolioList(BaseModel):
 @app.post("/api/portfolios")
 def save_portfolios_endpoint(data: PortfolioList):
     """Save all portfolios to backend storage (Supabase + Local Fallback)"""
+    registry.set_portfolio_symbols(portfolio_symbols(data.portfolios))
     if save_portfolios_to_db(data.portfolios):
         return {"status": "success", "count": len(data.portfolios)}
     else:
         raise HTTPException(status_code=500, detail="Failed to save portfolios")
 
+# Extractos de bróker: hasta 1 MB en memoria, el resto en disco
+IMPORT_SPOOL_BYTES = 1024 * 1024
+MAX_IMPORT_BYTES = 50 * 1024 * 1024
+
+def _import_into_portfolio(portfolio_id, raw):
+    portfolios = load_portfolios()
+    portfolio = next((p for p in portfolios if p.get("id") == portfolio_id), None)
+    if portfolio is None:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+
+    # ISINs already in any portfolio don't need a search
+    known = {
+        h["isin"]: h["symbol"]
+        for p in portfolios for h in p.get("holdings", []) if h.get("isin") and h.get("symbol")
+    }
+    try:
+        holdings, report = import_holdings(raw, _search, known)
+    except InvalidStatement as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if holdings:
+        portfolio["holdings"] = portfolio.get("holdings", []) + holdings
+        # A single write for the whole statement
+        if not save_portfolios_to_db(portfolios):
+            raise HTTPException(status_code=500, detail="Failed to save portfolios")
+        registry.set_portfolio_symbols(portfolio_symbols(portfolios))
+
+    log.info("Portfolio import", extra={
+        "portfolio": portfolio_id, "imported": report["imported"], "skipped": report["skipped"],
+        "symbols": report["symbols"]})
+    return dict(report, status="success", portfolio=portfolio)
+
+@app.post("/api/portfolios/{portfolio_id}/import")
+async def import_portfolio_endpoint(portfolio_id: str, request: Request):
+    """
+    Importa un extracto CSV de DEGIRO o IBKR (el fichero va tal cual en el cuerpo de la
+    petición) y añade sus compras a la cartera.
+    """
+    size = 0
+    with tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES) as raw:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > MAX_IMPORT_BYTES:
+                raise HTTPException(status_code=413, detail="File too large")
+            raw.write(chunk)
+        return await run_in_threadpool(_import_into_portfolio, portfolio_id, raw)
+
 @app.get("/")
 def read_root():
     return {"status": "active", "system": "BolsaIA Superintelligence"}
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Métricas en formato Prometheus"""
+    return metrics_response()
+
+
+def _fetch_search(q):
+    # We removed &region=ES to allow global results like Visa (V) while still finding European stocks
+    url = f"https://query2.finance.yahoo.com/v1/finance/search?q={q}"
+    headers = {'User-Agent': 'Mozilla/5.0'}
+    response = requests.get(url, headers=headers, timeout=10)
+    response.raise_for_status()
+    data = response.json()
+
+    results = []
+    if 'quotes' in data:
+        for item in data['quotes']:
+            if 'symbol' in item:
+                results.append({
+                    "symbol": item['symbol'],
+                    "name": item.get('longname') or item.get('shortname') or item['symbol'],
+                    "type": item.get('quoteType', 'Unknown'),
+                    "exchange": item.get('exchange', 'Unknown')
+                })
+    return results
+
+def _search(q):
+    results, _ = cached_call(
+        "search", q.lower(), CACHE_TTLS["search"], "yahoo_search", _fetch_search, q, operation="search")
+    return results
+
 @app.get("/api/search")
-def search_symbol(q: str):
+def search_symbol(q: str, response: Response):
     """Busca símbolos usando la API de Yahoo Finance"""
     try:
-        # We removed &region=ES to allow global results like Visa (V) while still finding European stocks
-        url = f"https://query2.finance.yahoo.com/v1/finance/search?q={q}"
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        response = requests.get(url, headers=headers)
-        data = response.json()
-        
-        results = []
-        if 'quotes' in data:
-            for item in data['quotes']:
-                if 'symbol' in item:
-                    results.append({
-                        "symbol": item['symbol'],
-                        "name": item.get('longname') or item.get('shortname') or item['symbol'],
-                        "type": item.get('quoteType', 'Unknown'),
-                        "exchange": item.get('exchange', 'Unknown')
-                    })
+        results, stale = cached_call(
+            "search", q.lower(), CACHE_TTLS["search"], "yahoo_search", _fetch_search, q, operation="search")
+        mark_stale(response, stale)
         return results
     except Exception as e:
-        print(f"Search error: {e}")
+        log.error("Search error", extra={"query": q, "error": str(e)})
         return []
 
+def _fetch_info(symbol):
+    return yf.Ticker(symbol).info
+
 @app.get("/api/quote/{symbol}")
 def get_quote(symbol: str):
     """Obtiene datos en tiempo real de una acción"""
+    registry.touch([symbol])
     try:
-        ticker = yf.Ticker(symbol)
-        info = ticker.info
+        info, stale = cached_call(
+            "quote_info", symbol.upper(), market_ttl(symbol, CACHE_TTLS["quote_info"]), "yfinance",
+            _fetch_info, symbol, operation="info")
         
         # Translate sector if exists
         sector = info.get("sector")
         if sector:
-            try:
-                sector = translator.translate(sector)
-            except:
-                pass
+            sector = translate(sector)
 
         # Currency logic with fallback for European markets
         currency = info.get("currency")
         
         # If missing or USD, check suffix to ensure correct currency for European/Global stocks
         if not currency or currency == "USD":
-            suffix = symbol.split('.')[-1] if '.' in symbol else ""
-            if suffix in ['MI', 'PA', 'MC', 'DE', 'AS', 'BR', 'LS', 'VI', 'IR']:
-                currency = "EUR"
-            elif suffix == 'L':
-                currency = "GBP"
-            elif suffix == 'TO':
-                currency = "CAD"
-            elif not currency:
-                currency = "USD"
+            currency = currency_from_suffix(symbol) or currency or "USD"
 
         # Extract key data safely
         data = {
@@ -201,110 +371,310 @@ def get_quote(symbol: str):
             "forwardPE": info.get("forwardPE"),
             "dividendYield": info.get("dividendYield"),
             "dividendRate": info.get("dividendRate"),
-            "currency": currency
+            "currency": currency,
+            "stale": stale
         }
         return data
+    except UpstreamUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Error fetching data: {str(e)}")
 
+def _history(symbol, **kwargs):
+    """
+    Histórico de yfinance. Vacío nunca es un resultado válido (un símbolo sin datos lanza
+    su propio error): se trata como fallo para no guardarlo como último valor bueno.
+    """
+    history = yf.Ticker(symbol).history(**kwargs)
+    if history.empty:
+        raise EmptyResponse(f"Empty history for {symbol}")
+    return history
+
+def _fetch_dividends(symbol):
+    # Same request yfinance makes for `.dividends`, but an empty answer is told apart
+    # from a stock that simply pays no dividends
+    history = _history(symbol, period="max", interval="1d")
+    dividends = history["Dividends"] if "Dividends" in history else pd.Series(dtype="float64")
+    dividends = dividends[dividends > 0]
+    if dividends.empty:
+        return pd.DataFrame({"amount": pd.Series(dtype="float64")}, index=pd.DatetimeIndex([]))
+    # Sort descending by date; keep the exchange's local dates
+    dividends = dividends.sort_index(ascending=False)
+    if isinstance(dividends.index, pd.DatetimeIndex) and dividends.index.tz is not None:
+        dividends.index = dividends.index.tz_localize(None)
+    return dividends.rename("amount").to_frame()
+
 @app.get("/api/dividends/{symbol}")
-def get_dividends(symbol: str):
+def get_dividends(symbol: str, request: Request, response: Response):
     """Obtiene el historial de dividendos"""
+    registry.touch([symbol])
     try:
-        ticker = yf.Ticker(symbol)
-        dividends = ticker.dividends
-        
-        data = []
-        if not dividends.empty:
-            # Sort descending by date
-            dividends = dividends.sort_index(ascending=False)
-            
-            for date, amount in dividends.items():
-                data.append({
-                    "date": date.strftime("%Y-%m-%d"),
-                    "year": int(date.strftime("%Y")),
-                    "amount": float(amount)
-                })
-        return data
+        dividends, stale = cached_call(
+            "dividends", symbol.upper(), CACHE_TTLS["dividends"], "yfinance", _fetch_dividends, symbol,
+            operation="dividends")
+
+        fmt = negotiate(request.headers.get("accept"))
+        if fmt:
+            columns = frame_columns(dividends)
+            columns["year"] = dividends.index.year.values
+            return columnar_response(columns, fmt, headers=stale_headers(stale))
+
+        mark_stale(response, stale)
+        return [
+            {"date": date, "year": year, "amount": amount}
+            for date, year, amount in zip(
+                dividends.index.strftime("%Y-%m-%d"), dividends.index.year.tolist(), dividends["amount"].tolist())
+        ]
     except Exception as e:
-        print(f"Dividend error: {e}")
+        log.error("Dividend error", extra={"symbol": symbol, "error": str(e)})
+        return []
+
+BAR_COLUMNS = {"Open": "open", "High": "high", "Low": "low", "Close": "close", "Volume": "volume"}
+
+def _fetch_chart(symbol, period, interval):
+    hist = _history(symbol, period=period, interval=interval)
+    # Keep only what the chart uses, in float32 and indexed by the exchange's local time
+    return compact_frame(hist, BAR_COLUMNS).rename(columns=BAR_COLUMNS)
+
+def bars_to_records(bars):
+    """Format for Recharts (Frontend): one dict per row"""
+    if bars.empty:
         return []
+    return [
+        {"date": date, "open": o, "high": h, "low": l, "close": c, "volume": v}
+        for date, o, h, l, c, v in zip(
+            bars.index.strftime("%Y-%m-%d"), widen(bars["open"]).tolist(), widen(bars["high"]).tolist(),
+            widen(bars["low"]).tolist(), widen(bars["close"]).tolist(), bars["volume"].tolist())
+    ]
+
+def _load_chart(symbol, period, interval):
+    try:
+        bars, stale = cached_call(
+            "bars", f"{symbol.upper()}:{period}:{interval}", market_ttl(symbol, CACHE_TTLS["bars"]), "yfinance",
+            _fetch_chart, symbol, period, interval, operation="history")
+    except Exception as e:
+        if not is_client_error(e):
+            raise
+        # Unknown or delisted symbol: an empty chart (not cached, the symbol may start trading)
+        empty = pd.DataFrame({name: pd.Series(dtype="float64") for name in BAR_COLUMNS})
+        bars, stale = compact_frame(empty).rename(columns=BAR_COLUMNS), False
+    # The bars cache already keeps them: the job result is only for whoever polls it
+    return (bars, stale), False
+
+def render_chart(result, request):
+    bars, stale = result
+    fmt = negotiate(request.headers.get("accept"))
+    if fmt:
+        return columnar_response(frame_columns(bars), fmt, headers=stale_headers(stale), compact=True)
+    return JSONResponse(bars_to_records(bars), headers=stale_headers(stale))
+
+# Full histories take seconds to download: they go through the job queue
+JOB_PERIODS = {"max"}
 
 @app.get("/api/chart/{symbol}")
-def get_chart_data(symbol: str, period: str = "1mo", interval: str = "1d"):
+def get_chart_data(symbol: str, request: Request, period: str = "1mo", interval: str = "1d"):
     """Obtiene datos históricos para gráficos"""
+    registry.touch([symbol])
+    if period in JOB_PERIODS:
+        # Fresh bars are served right away: only a cache miss goes through the queue
+        cached, found = get_cache().get(f"bars:{symbol.upper()}:{period}:{interval}")
+        if found:
+            return render_chart(cached, request)
+        job = run_job(request, "chart", f"chart:{symbol.upper()}:{period}:{interval}",
+                      _load_chart, symbol, period, interval)
+        if job["status"] == DONE:
+            return render_chart(job["result"], request)
+        if job["status"] == FAILED:
+            raise HTTPException(status_code=503, detail=job["error"])
+        return job_accepted(job)
     try:
-        ticker = yf.Ticker(symbol)
-        hist = ticker.history(period=period, interval=interval)
-        
-        # Format for Recharts (Frontend)
-        chart_data = []
-        for date, row in hist.iterrows():
-            chart_data.append({
-                "date": date.strftime("%Y-%m-%d"),
-                "open": row["Open"],
-                "high": row["High"],
-                "low": row["Low"],
-                "close": row["Close"],
-                "volume": row["Volume"]
-            })
-            
-        return chart_data
+        result, _ = _load_chart(symbol, period, interval)
+        return render_chart(result, request)
+    except UpstreamUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _load_news(symbol):
+    """Noticias de Finviz traducidas. Devuelve ((noticias, stale), cacheable)"""
+    from scraper import fetch_finviz_news
+    try:
+        news, stale = cached_call(
+            "news", symbol.upper(), CACHE_TTLS["news"], "finviz", fetch_finviz_news, symbol, operation="news")
+    except UpstreamUnavailable as e:
+        # Finviz is failing/throttling us and we have nothing cached: no fake items
+        log.warning("News unavailable", extra={"symbol": symbol, "error": str(e)})
+        return ([], False), False
+    log.info("News fetched", extra={"symbol": symbol, "count": len(news), "stale": stale})
+
+    if not news:
+        return ([{
+            "title": f"No hay noticias recientes para {symbol}",
+            "link": "#",
+            "time": "Ahora",
+            "source": "Sistema BolsaIA"
+        }], False), True
+
+    # Translate news titles (on copies: the originals are kept as last good value)
+    translated_news = []
+    for item in news:
+        item = dict(item)
+        # Basic check to avoid translating empty strings
+        if item.get('title'):
+            item['title'] = translate(item['title'])
+        translated_news.append(item)
+
+    return (translated_news, stale), not stale
+
+def _is_cached(namespace, key):
+    return get_cache().get(f"{namespace}:{key}")[1]
+
+def _news_cached(symbol):
+    """True si las noticias y sus traducciones están frescas: _load_news no saldrá a la red"""
+    entry, found = get_cache().get(f"news:{symbol.upper()}")
+    return found and all(_is_cached("translations", item["title"]) for item in entry[0] if item.get("title"))
+
+def _sentiment_cached(symbol):
+    """True si _analyze_sentiment puede responder solo con la caché (TextBlob es local)"""
+    entry, found = get_cache().get(f"news:{symbol.upper()}")
+    return found and (not GEN_API_KEY or not entry[0] or _is_cached("sentiment", symbol.upper()))
+
+def render_news(result, request):
+    news, stale = result
+    return JSONResponse(news, headers=stale_headers(stale))
+
 @app.get("/api/news/{symbol}")
-def get_news(symbol: str):
+def get_news(symbol: str, request: Request):
     """Obtiene noticias de la acción desde Finviz y las traduce"""
-    try:
-        from scraper import get_finviz_news, get_market_sentiment
-        print(f"Fetching news for {symbol}...")
-        news = get_finviz_news(symbol)
-        print(f"Found {len(news)} news items for {symbol}")
-        
-        # Translate news titles
-        translated_news = []
-        if not news:
-            # DEBUG: Return a placeholder to alert the user/dev
-            return [{
-                "title": f"No hay noticias recientes para {symbol} (o Finviz bloqueado)",
-                "link": "#",
-                "time": "Ahora",
-                "source": "Sistema BolsaIA"
-            }]
-
-        for item in news:
-            try:
-                # Basic check to avoid translating empty strings
-                if item.get('title'):
-                    # Translation can be slow, maybe limit to top 3 to speed up?
-                    item['title'] = translator.translate(item['title'])
-            except Exception as e:
-                print(f"Translation error: {e}")
-            translated_news.append(item)
-            
-        return translated_news
-    except Exception as e:
-        # Fallback to empty list or error
-        print(f"News error: {e}")
+    registry.touch([symbol])
+    if _news_cached(symbol):
+        # Fresh in the cache (usually thanks to the prefetch): answer inline
+        result, _ = _load_news(symbol)
+        return render_news(result, request)
+    job = run_job(request, "news", f"news:{symbol.upper()}", _load_news, symbol)
+    if job["status"] == DONE:
+        return render_news(job["result"], request)
+    if job["status"] == FAILED:
+        log.error("News error", extra={"symbol": symbol, "error": job["error"]})
         return [{
-            "title": f"Error cargando noticias: {str(e)}",
+            "title": f"Error cargando noticias: {job['error']}",
             "link": "#",
             "time": "Error",
             "source": "Sistema"
         }]
+    return job_accepted(job)
 
 
 class SymbolsRequest(BaseModel):
     symbols: List[str]
 
+TYPE_MAP = {
+    'EQUITY': 'Acción',
+    'ETF': 'ETF',
+    'MUTUALFUND': 'Fondo',
+    'CRYPTOCURRENCY': 'Cripto',
+    'FUTURE': 'Futuro',
+    'INDEX': 'Índice',
+    'CURRENCY': 'Divisa'
+}
+
+def _fetch_batch_quote(ticker, symbol):
+    """
+    Precio y metadatos de un símbolo para /api/quotes.
+    Lanza la excepción de yfinance si no hay forma de obtener el precio, o NoData
+    si Yahoo responde pero sin precio (símbolo inválido).
+    """
+    price = 0
+    change_percent = 0
+    info = None
+
+    # 1. Try to get Price from fast_info (Fast & Reliable)
+    try:
+        with span("yfinance", "fast_info"):
+            price = ticker.fast_info.last_price
+            prev_close = ticker.fast_info.previous_close
+        change_percent = ((price - prev_close) / prev_close) * 100 if prev_close else 0
+    except Exception:
+        # Fallback to info for price if fast_info fails
+        with span("yfinance", "info"):
+            info = ticker.info
+        price = info.get("currentPrice") or info.get("regularMarketPrice") or 0
+        change_percent = info.get("regularMarketChangePercent", 0) * 100
+
+    if not price:
+        raise NoData(f"No price for {symbol}")
+
+    # 2. Try to get Metadata (Name, Type) - Slower / Can Fail
+    try:
+        # Ensure we have info if not already fetched
+        if not info:
+            with span("yfinance", "info"):
+                info = ticker.info
+
+        # Clean up name
+        raw_name = info.get('longName') or info.get('shortName') or symbol
+        name = raw_name.replace(" R", "").strip()
+        
+        quote_type_raw = info.get('quoteType', 'UNKNOWN')
+        currency = info.get('currency')
+        
+        # If currency is missing in info, try fast_info if available
+        if not currency:
+            try:
+                with span("yfinance", "fast_info"):
+                    currency = ticker.fast_info.currency
+            except:
+                pass
+        
+        if not currency:
+            currency = "USD" # Default
+        
+        asset_type = TYPE_MAP.get(quote_type_raw, quote_type_raw)
+
+    except Exception as e:
+        # If fetching info fails completely, try to infer minimal data
+        log.warning("Error fetching metadata", extra={"symbol": symbol, "error": str(e)})
+        name = symbol
+        asset_type = "Unknown"
+        
+        # Suffix-based currency fallback
+        currency = currency_from_suffix(symbol) or "USD"
+
+    return {
+        "price": price,
+        "change": change_percent,
+        "name": name,
+        "type": asset_type,
+        "currency": currency
+    }
+
+def quotes_to_columns(results):
+    """Resultado de /api/quotes en columnas (una fila por símbolo)"""
+    symbols = list(results)
+    rows = [results[s] for s in symbols]
+    columns = {"symbol": symbols}
+    for field in ("price", "change"):
+        columns[field] = np.array([r.get(field, np.nan) for r in rows], dtype=np.float64)
+    for field in ("name", "type", "currency", "error"):
+        columns[field] = [r.get(field) for r in rows]
+    columns["stale"] = np.array([bool(r.get("stale")) for r in rows])
+    return columns
+
 @app.post("/api/quotes")
-def get_batch_quotes(request: SymbolsRequest):
+def get_batch_quotes(request: SymbolsRequest, http_request: Request):
     """Obtiene datos de múltiples acciones a la vez"""
+    results = _batch_quotes(request)
+    fmt = negotiate(http_request.headers.get("accept"))
+    if fmt:
+        return columnar_response(quotes_to_columns(results), fmt)
+    return results
+
+def _batch_quotes(request: SymbolsRequest):
     try:
         symbols = request.symbols
         if not symbols:
             return {}
+        registry.touch(symbols)
             
         # yfinance allows fetching multiple tickers space-separated
         tickers_str = " ".join(symbols)
@@ -312,263 +682,343 @@ def get_batch_quotes(request: SymbolsRequest):
         
         results = {}
         for symbol in symbols:
-            # Default values
-            price = 0
-            change_percent = 0
-            name = symbol
-            asset_type = "Unknown"
-            
-            # 1. Try to get Price from fast_info (Fast & Reliable)
             try:
                 ticker = tickers.tickers[symbol.upper()]
-                price = ticker.fast_info.last_price
-                prev_close = ticker.fast_info.previous_close
-                change_percent = ((price - prev_close) / prev_close) * 100 if prev_close else 0
-            except:
-                # Fallback to info for price if fast_info fails
-                try:
-                    info = ticker.info
-                    price = info.get("currentPrice") or info.get("regularMarketPrice") or 0
-                    change_percent = info.get("regularMarketChangePercent", 0) * 100
-                except:
-                    pass # Keep 0 if everything fails
-
-            # 2. Try to get Metadata (Name, Type) - Slower / Can Fail
-            try:
-                # Ensure we have info if not already fetched
-                if 'info' not in locals() or not info:
-                    info = ticker.info
-
-                # Clean up name
-                raw_name = info.get('longName') or info.get('shortName') or symbol
-                name = raw_name.replace(" R", "").strip()
-                
-                quote_type_raw = info.get('quoteType', 'UNKNOWN')
-                currency = info.get('currency')
-                
-                # If currency is missing in info, try fast_info if available
-                if not currency:
-                    try:
-                        currency = ticker.fast_info.currency
-                    except:
-                        pass
-                
-                if not currency:
-                    currency = "USD" # Default
-                
-                type_map = {
-                    'EQUITY': 'Acción',
-                    'ETF': 'ETF',
-                    'MUTUALFUND': 'Fondo',
-                    'CRYPTOCURRENCY': 'Cripto',
-                    'FUTURE': 'Futuro',
-                    'INDEX': 'Índice',
-                    'CURRENCY': 'Divisa'
-                }
-                asset_type = type_map.get(quote_type_raw, quote_type_raw)
-
+                quote, stale = cached_call(
+                    "quotes", symbol.upper(), market_ttl(symbol, CACHE_TTLS["quotes"]), "yfinance",
+                    _fetch_batch_quote, ticker, symbol, operation="quote")
+                results[symbol] = dict(quote, stale=True) if stale else quote
             except Exception as e:
-                # If fetching info fails completely, try to infer minimal data
-                print(f"Error fetching metadata for {symbol}: {e}")
-                name = symbol
-                asset_type = "Unknown"
-                
-                # Suffix-based currency fallback
-                suffix = symbol.split('.')[-1] if '.' in symbol else ""
-                if suffix in ['MI', 'PA', 'MC', 'DE', 'AS', 'BR', 'LS', 'VI', 'IR']:
-                    currency = "EUR"
-                elif suffix == 'L':
-                    currency = "GBP"
-                elif suffix == 'TO':
-                    currency = "CAD"
-                else:
-                    currency = "USD"
-
-            # 3. Construct Result
-            if price != 0:
-                results[symbol] = {
-                    "price": price,
-                    "change": change_percent,
-                    "name": name,
-                    "type": asset_type,
-                    "currency": currency
-                }
-            else:
-                 results[symbol] = {"error": "N/A"}
+                log.debug("Batch quote unavailable", extra={"symbol": symbol, "error": str(e)})
+                results[symbol] = {"error": "N/A"}
                     
         return results
     except Exception as e:
-        print(f"Batch quote error: {e}")
+        log.error("Batch quote error", extra={"error": str(e)})
         return {}
 
+def _fetch_price_at_date(symbol, date):
+    from datetime import datetime, timedelta
+    
+    target_date = datetime.strptime(date, "%Y-%m-%d")
+    start_date = (target_date - timedelta(days=5)).strftime("%Y-%m-%d")
+    end_date = (target_date + timedelta(days=1)).strftime("%Y-%m-%d") 
+    
+    history = _history(symbol, start=start_date, end=end_date)
+    
+    filtered = history[history.index.tz_localize(None) <= target_date]
+    
+    if filtered.empty:
+        # Raised, not returned: an error must not get a closed session's 30-day TTL
+        raise NoData("No trading data found on or before this date")
+         
+    row = filtered.iloc[-1] 
+    actual_date = filtered.index[-1].strftime("%Y-%m-%d")
+    
+    return {
+        "symbol": symbol.upper(),
+        "request_date": date,
+        "found_date": actual_date,
+        "close": row["Close"]
+    }
+
 @app.get("/api/price-at-date/{symbol}/{date}")
 def get_price_at_date(symbol: str, date: str):
     """
     Obtiene el precio de cierre de una acción en una fecha específica (YYYY-MM-DD).
     """
     try:
-        from datetime import datetime, timedelta
-        
-        target_date = datetime.strptime(date, "%Y-%m-%d")
-        start_date = (target_date - timedelta(days=5)).strftime("%Y-%m-%d")
-        end_date = (target_date + timedelta(days=1)).strftime("%Y-%m-%d") 
-        
-        ticker = yf.Ticker(symbol)
-        history = ticker.history(start=start_date, end=end_date)
-        
-        if history.empty:
-            return {"error": "No data found for this range"}
-        
-        filtered = history[history.index.tz_localize(None) <= target_date]
-        
-        if filtered.empty:
-             return {"error": "No trading data found on or before this date"}
-             
-        row = filtered.iloc[-1] 
-        actual_date = filtered.index[-1].strftime("%Y-%m-%d")
-        
-        return {
-            "symbol": symbol.upper(),
-            "request_date": date,
-            "found_date": actual_date,
-            "close": row["Close"]
-        }
+        ttl = session_ttl(symbol, datetime.strptime(date, "%Y-%m-%d").date(), CACHE_TTLS["price_at"])
+        data, stale = cached_call(
+            "price_at", f"{symbol.upper()}:{date}", ttl, "yfinance",
+            _fetch_price_at_date, symbol, date, operation="history")
+        return dict(data, stale=True) if stale else data
             
     except Exception as e:
-        print(f"History price error: {e}")
+        log.error("History price error", extra={"symbol": symbol, "date": date, "error": str(e)})
         return {"error": str(e)}
 
+def _load_market_sentiment():
+    from scraper import get_market_sentiment
+    data = get_market_sentiment()
+    # Only cache it when every source answered (or none of them is stale)
+    return data, not data.get("stale")
+
 @app.get("/api/market-sentiment")
 def get_general_market_sentiment():
     """
     Obtiene el sentimiento general del mercado (Fear & Greed index simulado).
     """
     try:
-        from scraper import get_market_sentiment
-        return get_market_sentiment()
+        data, _ = get_or_load(
+            "market_sentiment", "global", CACHE_TTLS["market_sentiment"], _load_market_sentiment)
+        return data
     except Exception as e:
-        print(f"Market sentiment error: {e}")
+        log.error("Market sentiment error", extra={"error": str(e)})
         return {"index": "Neutral", "value": 50, "error": str(e)}
 
-@app.get("/api/sentiment/{symbol}")
-def get_sentiment(symbol: str):
+def _analyze_with_gemini(symbol, headlines):
+    """Pide a Gemini el análisis de los titulares. Lanza excepción si la respuesta no es válida"""
+    model = genai.GenerativeModel('gemini-2.0-flash')
+    news_text = "\n".join(f"- {h}" for h in headlines)
+    
+    prompt = f"""
+    Analiza los siguientes titulares financieros sobre la acción {symbol} y actúa como un experto financiero senior.
+    
+    Titulares:
+    {news_text}
+    
+    Responde ÚNICAMENTE con un objeto JSON (sin markdown) con este formato:
+    {{
+        "score": <float entre -1.0 (Muy Negativo) y 1.0 (Muy Positivo)>,
+        "label": <"Bullish" o "Bearish" o "Neutral">,
+        "confidence": <float entre 0.0 y 1.0>,
+        "summary": <Resumen conciso en Español de lo que pasa en 2 frases>,
+        "recommendation": <"Comprar", "Vender" o "Mantener">
+    }}
+    """
+    
+    response = model.generate_content(prompt)
+    
+    # Clean up response text to ensure it's valid JSON
+    cleaned_text = response.text.replace('```json', '').replace('```', '').strip()
+    result = json.loads(cleaned_text)
+    
+    # Validation check
+    if "score" not in result:
+        raise ValueError("Gemini response without score")
+
+    # Add news count for UI context
+    result["news_count"] = len(headlines)
+    
+    # Ensure color property exists for UI mapping
+    # Map label to color if not present, though UI logic might handle it
+    if result.get("score") > 0.1:
+        result["color"] = "green"
+    elif result.get("score") < -0.1:
+        result["color"] = "red"
+    else:
+        result["color"] = "gray"
+        
+    # Normalize score to 0-100 logic for gauge if needed, or send raw 
+    # UI expects 0-100? Let's check. 
+    # TextBlob logic was doing normalization.
+    # Let's trust the UI handles 0-100.
+    # Gemini returns -1 to 1.
+    result["score"] = int(((result["score"] + 1) / 2) * 100)
+    
+    return result
+
+def _analyze_sentiment(symbol):
     """
     Analiza las noticias recientes usando Google Gemini Pro (si está disponible) o TextBlob.
-    Devuelve score, etiqueta, resumen y recomendación.
+    Devuelve (resultado, cacheable): el resultado de TextBlob por un fallo de Gemini no se cachea.
     """
+    from textblob import TextBlob
+    from scraper import fetch_finviz_news
+
+    # Get RAW news (English) from Finviz
     try:
-        from textblob import TextBlob
-        from scraper import get_finviz_news
-        
-        # Get RAW news (English) from Finviz
-        news = get_finviz_news(symbol)
-        
-        if not news:
-            return {"score": 0, "label": "Neutral", "confidence": 0, "summary": "No hay noticias recientes.", "recommendation": "Hold"}
+        news, news_stale = cached_call(
+            "news", symbol.upper(), CACHE_TTLS["news"], "finviz", fetch_finviz_news, symbol, operation="news")
+    except UpstreamUnavailable as e:
+        log.warning("News unavailable for sentiment", extra={"symbol": symbol, "error": str(e)})
+        return {"score": 0, "label": "Neutral", "confidence": 0, "summary": "No hay noticias recientes.", "recommendation": "Hold"}, False
 
-        # 1. Try Gemini API first
-        if GEN_API_KEY:
-            try:
-                model = genai.GenerativeModel('gemini-2.0-flash')
-                
-                # Prepare prompt with news titles
-                headlines = [item['title'] for item in news[:10]] # Limit to recent 10
-                news_text = "\n".join(f"- {h}" for h in headlines)
-                
-                prompt = f"""
-                Analiza los siguientes titulares financieros sobre la acción {symbol} y actúa como un experto financiero senior.
-                
-                Titulares:
-                {news_text}
-                
-                Responde ÚNICAMENTE con un objeto JSON (sin markdown) con este formato:
-                {{
-                    "score": <float entre -1.0 (Muy Negativo) y 1.0 (Muy Positivo)>,
-                    "label": <"Bullish" o "Bearish" o "Neutral">,
-                    "confidence": <float entre 0.0 y 1.0>,
-                    "summary": <Resumen conciso en Español de lo que pasa en 2 frases>,
-                    "recommendation": <"Comprar", "Vender" o "Mantener">
-                }}
-                """
-                
-                response = model.generate_content(prompt)
-                
-                # Clean up response text to ensure it's valid JSON
-                cleaned_text = response.text.replace('```json', '').replace('```', '').strip()
-                result = json.loads(cleaned_text)
-                
-                # Validation check
-                if "score" in result:
-                    # Add news count for UI context
-                    result["news_count"] = len(headlines)
-                    
-                    # Ensure color property exists for UI mapping
-                    # Map label to color if not present, though UI logic might handle it
-                    if result.get("score") > 0.1:
-                        result["color"] = "green"
-                    elif result.get("score") < -0.1:
-                        result["color"] = "red"
-                    else:
-                        result["color"] = "gray"
-                        
-                    # Normalize score to 0-100 logic for gauge if needed, or send raw 
-                    # UI expects 0-100? Let's check. 
-                    # TextBlob logic was doing normalization.
-                    # Let's trust the UI handles 0-100.
-                    # Gemini returns -1 to 1.
-                    result["score"] = int(((result["score"] + 1) / 2) * 100)
-                    
-                    return result
+    if not news:
+        return {"score": 0, "label": "Neutral", "confidence": 0, "summary": "No hay noticias recientes.", "recommendation": "Hold"}, True
 
-            except Exception as e:
-                print(f"Gemini Error: {e}")
-                # Fallback to TextBlob if Gemini fails
-        
-        # 2. Fallback to TextBlob (Local NLP)
-        print("Using TextBlob Fallback")
-        total_polarity = 0
-        count = 0
-        
-        for item in news:
-            title = item.get('title', '')
-            if title:
-                blob = TextBlob(title)
-                total_polarity += blob.sentiment.polarity
-                count += 1
-                
-        avg_polarity = total_polarity / count if count > 0 else 0
-        
-        # Determine label
-        if avg_polarity > 0.1:
-            label = "Bullish"
-            rec = "Comprar"
-            color = "green"
-        elif avg_polarity < -0.1:
-            label = "Bearish"
-            rec = "Vender"
-            color = "red"
-        else:
-            label = "Neutral"
-            rec = "Mantener"
-            color = "gray"
-
-        # Normalize score to 0-100
-        normalized_score = int(((avg_polarity + 1) / 2) * 100)
-            
-        return {
-            "symbol": symbol.upper(),
-            "score": normalized_score, 
-            "label": label, 
-            "color": color,
-            "confidence": 0.5,
-            "summary": "Análisis básico de palabras clave (Modo Offline).",
-            "recommendation": rec,
-            "news_count": count
-        }
-            
-    except Exception as e:
-        print(f"Sentiment Error: {e}")
+    # 1. Try Gemini API first
+    if GEN_API_KEY:
+        try:
+            headlines = [item['title'] for item in news[:10]] # Limit to recent 10
+            result, stale = cached_call(
+                "sentiment", symbol.upper(), CACHE_TTLS["sentiment"], "gemini",
+                _analyze_with_gemini, symbol, headlines, operation="generate_content")
+            stale = stale or news_stale
+            return dict(result, stale=stale), not stale
+
+        except Exception as e:
+            log.warning("Gemini error", extra={"symbol": symbol, "error": str(e)})
+            # Fallback to TextBlob if Gemini fails
+
+    # 2. Fallback to TextBlob (Local NLP)
+    log.info("Using TextBlob fallback", extra={"symbol": symbol})
+    total_polarity = 0
+    count = 0
+
+    for item in news:
+        title = item.get('title', '')
+        if title:
+            blob = TextBlob(title)
+            total_polarity += blob.sentiment.polarity
+            count += 1
+
+    avg_polarity = total_polarity / count if count > 0 else 0
+
+    # Determine label
+    if avg_polarity > 0.1:
+        label = "Bullish"
+        rec = "Comprar"
+        color = "green"
+    elif avg_polarity < -0.1:
+        label = "Bearish"
+        rec = "Vender"
+        color = "red"
+    else:
+        label = "Neutral"
+        rec = "Mantener"
+        color = "gray"
+
+    # Normalize score to 0-100
+    normalized_score = int(((avg_polarity + 1) / 2) * 100)
+
+    return {
+        "symbol": symbol.upper(),
+        "score": normalized_score,
+        "label": label,
+        "color": color,
+        "confidence": 0.5,
+        "summary": "Análisis básico de palabras clave (Modo Offline).",
+        "recommendation": rec,
+        "news_count": count,
+        "stale": news_stale
+    }, not GEN_API_KEY and not news_stale
+
+@app.get("/api/sentiment/{symbol}")
+def get_sentiment(symbol: str, request: Request):
+    """
+    Sentimiento de las noticias recientes: score, etiqueta, resumen y recomendación.
+    """
+    registry.touch([symbol])
+    if _sentiment_cached(symbol):
+        result, _ = _analyze_sentiment(symbol)
+        return result
+    job = run_job(request, "sentiment", f"sentiment:{symbol.upper()}", _analyze_sentiment, symbol)
+    if job["status"] == DONE:
+        return job["result"]
+    if job["status"] == FAILED:
+        log.error("Sentiment error", extra={"symbol": symbol, "error": job["error"]})
         return {"score": 0, "label": "Error", "summary": "Error al analizar noticias."}
+    return job_accepted(job)
+
+# --- Background jobs ---
+
+class JobRequest(BaseModel):
+    kind: str
+    symbol: str
+    period: str = "max"
+    interval: str = "1d"
+
+def _job_spec(job: JobRequest):
+    """(clave, función, argumentos) de los trabajos que acepta POST /api/jobs"""
+    symbol = job.symbol.upper()
+    if job.kind == "news":
+        return f"news:{symbol}", _load_news, (symbol,)
+    if job.kind == "sentiment":
+        return f"sentiment:{symbol}", _analyze_sentiment, (symbol,)
+    if job.kind == "chart":
+        return f"chart:{symbol}:{job.period}:{job.interval}", _load_chart, (symbol, job.period, job.interval)
+    return None
+
+JOB_RENDERERS = {
+    "news": render_news,
+    "sentiment": lambda result, request: result,
+    "chart": render_chart,
+}
+
+@app.post("/api/jobs")
+def submit_job(job: JobRequest, request: Request):
+    """Lanza un análisis lento en segundo plano y devuelve el trabajo para consultarlo"""
+    spec = _job_spec(job)
+    if spec is None:
+        raise HTTPException(status_code=400, detail=f"Unknown job kind: {job.kind}")
+    key, fn, args = spec
+    registry.touch([job.symbol])
+    record = run_job(request, job.kind, key, fn, *args, wait=0)
+    if record["status"] == DONE:
+        return public(record)
+    return job_accepted(record)
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    """Estado de un trabajo (queued, running, done, failed)"""
+    record = jobs.get(job_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return public(record)
+
+@app.get("/api/jobs/{job_id}/result")
+def get_job_result(job_id: str, request: Request):
+    """Resultado de un trabajo; 202 mientras sigue en cola o en marcha"""
+    record = jobs.get(job_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    if record["status"] == FAILED:
+        raise HTTPException(status_code=500, detail=record["error"])
+    if record["status"] != DONE:
+        return job_accepted(record)
+    render = JOB_RENDERERS.get(record["kind"])
+    return render(record["result"], request) if render else public(record)
+
+# --- Background prefetch of hot symbols ---
+
+def _refresh_quote(symbol):
+    refresh_cached(
+        "quotes", symbol, market_ttl(symbol, CACHE_TTLS["quotes"]), "yfinance",
+        _fetch_batch_quote, yf.Ticker(symbol), symbol, operation="quote")
+
+def _refresh_bars(symbol):
+    # The dashboard always opens the 'max' daily chart
+    refresh_cached(
+        "bars", f"{symbol}:max:1d", market_ttl(symbol, CACHE_TTLS["bars"]), "yfinance",
+        _fetch_chart, symbol, "max", "1d", operation="history")
+
+def _refresh_dividends(symbol):
+    refresh_cached(
+        "dividends", symbol, CACHE_TTLS["dividends"], "yfinance", _fetch_dividends, symbol, operation="dividends")
+
+def _refresh_news(symbol):
+    from scraper import fetch_finviz_news
+    news, _ = refresh_cached(
+        "news", symbol, CACHE_TTLS["news"], "finviz", fetch_finviz_news, symbol, operation="news")
+    # Translate new headlines too, so /api/news answers straight from the cache
+    for item in news:
+        if item.get("title"):
+            translate(item["title"])
+
+def _refresh_sentiment(symbol):
+    from scraper import fetch_finviz_news
+    if not GEN_API_KEY:
+        return
+    news, _ = cached_call(
+        "news", symbol, CACHE_TTLS["news"], "finviz", fetch_finviz_news, symbol, operation="news")
+    if news:
+        headlines = [item['title'] for item in news[:10]]
+        refresh_cached(
+            "sentiment", symbol, CACHE_TTLS["sentiment"], "gemini",
+            _analyze_with_gemini, symbol, headlines, operation="generate_content")
+
+# Refresh a bit before the entry expires so user requests find it fresh
+PREFETCH_LEAD = 0.8
+
+scheduler = PrefetchScheduler(registry, portfolio_loader=load_portfolios, jobs=jobs)
+scheduler.register("quotes", CACHE_TTLS["quotes"] * PREFETCH_LEAD, "yfinance", _refresh_quote)
+scheduler.register("bars", CACHE_TTLS["bars"] * PREFETCH_LEAD, "yfinance", _refresh_bars)
+scheduler.register("dividends", CACHE_TTLS["dividends"] * PREFETCH_LEAD, "yfinance", _refresh_dividends,
+                   market_hours_only=False)
+scheduler.register("news", CACHE_TTLS["news"] * PREFETCH_LEAD, "finviz", _refresh_news, market_hours_only=False)
+scheduler.register("sentiment", CACHE_TTLS["sentiment"] * PREFETCH_LEAD, "gemini", _refresh_sentiment)
+
+@app.on_event("startup")
+def start_prefetch():
+    if os.getenv("PREFETCH_ENABLED", "1") == "1":
+        scheduler.start()
+
+@app.on_event("shutdown")
+def stop_background_work():
+    scheduler.stop()
+    jobs.stop()
 
 if __name__ == "__main__":
     import uvicorn
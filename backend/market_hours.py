@@ -0,0 +1,263 @@
+"""
+Calendario de mercados: horario, zona horaria y festivos de las bolsas que tenemos en cartera.
+
+Sirve para ajustar el TTL de la caché al estado del mercado:
+  - mercado abierto: el TTL normal (corto) de cada tipo de dato,
+  - mercado cerrado: hasta la siguiente apertura (con un máximo), porque el precio no cambia,
+  - cripto y símbolos desconocidos: siempre se tratan como abiertos (24/7).
+
+La bolsa se deduce del sufijo de Yahoo (SAN.MC -> BME, AIR.PA -> Euronext París); sin sufijo
+se asume EEUU. Los festivos son los principales de cada bolsa, calculados por año (Pascua
+incluida); no se modelan las sesiones reducidas.
+"""
+import threading
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+# Closing auctions and the last trades take a few minutes to show up in Yahoo
+SETTLE = timedelta(minutes=15)
+# Never keep a closed-market value longer than this (long weekends, holidays)
+MAX_CLOSED_TTL = 4 * 24 * 3600
+# A finished session's close doesn't change anymore
+CLOSED_SESSION_TTL = 30 * 24 * 3600
+
+CRYPTO_SUFFIXES = ("-USD", "-EUR", "-USDT", "-BTC")
+
+
+def is_crypto(symbol):
+    return symbol.upper().endswith(CRYPTO_SUFFIXES)
+
+
+# --- Festivos ---
+
+def easter(year):
+    """Domingo de Pascua (calendario gregoriano, algoritmo de Meeus/Jones/Butcher)"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _nth_weekday(year, month, weekday, n):
+    """n-ésimo día de la semana del mes (n=-1: el último)"""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _observed(day):
+    """Festivo en fin de semana: se traslada al viernes (sábado) o al lunes (domingo)"""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+def _monday_observed(*days):
+    """Festivos consecutivos que caen en fin de semana se trasladan a los siguientes días laborables"""
+    observed = []
+    for day in days:
+        while day.weekday() >= 5 or day in observed:
+            day += timedelta(days=1)
+        observed.append(day)
+    return observed
+
+
+def _europe_holidays(*extra):
+    """Festivos comunes de las bolsas europeas continentales más los propios de cada una"""
+    def holidays(year):
+        sunday = easter(year)
+        days = {date(year, 1, 1), sunday - timedelta(days=2), sunday + timedelta(days=1),
+                date(year, 5, 1), date(year, 12, 25), date(year, 12, 26)}
+        days.update(date(year, month, day) for month, day in extra)
+        return days
+    return holidays
+
+
+def _us_holidays(year):
+    new_year = date(year, 1, 1)
+    days = {
+        # A Saturday New Year's Day is not moved to the previous Friday
+        new_year + timedelta(days=1) if new_year.weekday() == 6 else new_year,
+        _nth_weekday(year, 1, 0, 3),  # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),  # Presidents' Day
+        easter(year) - timedelta(days=2),  # Good Friday
+        _nth_weekday(year, 5, 0, -1),  # Memorial Day
+        _observed(date(year, 7, 4)),
+        _nth_weekday(year, 9, 0, 1),  # Labor Day
+        _nth_weekday(year, 11, 3, 4),  # Thanksgiving
+        _observed(date(year, 12, 25)),
+    }
+    if year >= 2022:
+        days.add(_observed(date(year, 6, 19)))  # Juneteenth
+    return days
+
+
+def _uk_holidays(year):
+    sunday = easter(year)
+    return {
+        *_monday_observed(date(year, 1, 1)),
+        sunday - timedelta(days=2),
+        sunday + timedelta(days=1),
+        _nth_weekday(year, 5, 0, 1),  # Early May bank holiday
+        _nth_weekday(year, 5, 0, -1),  # Spring bank holiday
+        _nth_weekday(year, 8, 0, -1),  # Summer bank holiday
+        *_monday_observed(date(year, 12, 25), date(year, 12, 26)),
+    }
+
+
+def _canada_holidays(year):
+    may_25 = date(year, 5, 25)
+    return {
+        *_monday_observed(date(year, 1, 1)),
+        _nth_weekday(year, 2, 0, 3),  # Family Day
+        easter(year) - timedelta(days=2),
+        may_25 - timedelta(days=may_25.weekday() or 7),  # Victoria Day: Monday before May 25
+        *_monday_observed(date(year, 7, 1)),
+        _nth_weekday(year, 8, 0, 1),  # Civic Holiday
+        _nth_weekday(year, 9, 0, 1),  # Labour Day
+        _nth_weekday(year, 10, 0, 2),  # Thanksgiving
+        *_monday_observed(date(year, 12, 25), date(year, 12, 26)),
+    }
+
+
+# --- Bolsas ---
+
+class Exchange:
+    """Una bolsa: sesión continua en hora local y festivos por año"""
+
+    def __init__(self, code, tz, open_time, close_time, holidays):
+        self.code = code
+        self.tz = ZoneInfo(tz)
+        self.open_time = open_time
+        self.close_time = close_time
+        self._holidays = holidays
+        self._by_year = {}
+        self._lock = threading.Lock()
+
+    def holidays(self, year):
+        with self._lock:
+            if year not in self._by_year:
+                self._by_year[year] = frozenset(self._holidays(year))
+            return self._by_year[year]
+
+    def is_trading_day(self, day):
+        return day.weekday() < 5 and day not in self.holidays(day.year)
+
+    def session(self, day):
+        """Apertura y cierre (aware, hora local) de la sesión de ese día"""
+        return (datetime.combine(day, self.open_time, self.tz),
+                datetime.combine(day, self.close_time, self.tz))
+
+    def is_open(self, now):
+        local = now.astimezone(self.tz)
+        if not self.is_trading_day(local.date()):
+            return False
+        opens, closes = self.session(local.date())
+        return opens <= local < closes + SETTLE
+
+    def next_open(self, now):
+        local = now.astimezone(self.tz)
+        day = local.date()
+        for _ in range(15):
+            if self.is_trading_day(day):
+                opens, _ = self.session(day)
+                if opens > local:
+                    return opens
+            day += timedelta(days=1)
+        return local + timedelta(seconds=MAX_CLOSED_TTL)
+
+    def session_closed(self, day, now):
+        """True si la sesión de ese día ya terminó (o no la hubo y el día ya pasó)"""
+        local = now.astimezone(self.tz)
+        if day != local.date():
+            return day < local.date()
+        if not self.is_trading_day(day):
+            return False
+        _, closes = self.session(day)
+        return local >= closes + SETTLE
+
+
+EUROPEAN_CLOSE = time(17, 30)
+
+EXCHANGES = {
+    "NYSE": Exchange("NYSE", "America/New_York", time(9, 30), time(16), _us_holidays),
+    "TSX": Exchange("TSX", "America/Toronto", time(9, 30), time(16), _canada_holidays),
+    "LSE": Exchange("LSE", "Europe/London", time(8), time(16, 30), _uk_holidays),
+    "BME": Exchange("BME", "Europe/Madrid", time(9), EUROPEAN_CLOSE, _europe_holidays()),
+    "XETRA": Exchange("XETRA", "Europe/Berlin", time(9), EUROPEAN_CLOSE,
+                      _europe_holidays((12, 24), (12, 31))),
+    "FRA": Exchange("FRA", "Europe/Berlin", time(8), time(22), _europe_holidays((12, 24), (12, 31))),
+    "MIL": Exchange("MIL", "Europe/Rome", time(9), EUROPEAN_CLOSE,
+                    _europe_holidays((8, 15), (12, 24), (12, 31))),
+    "PAR": Exchange("PAR", "Europe/Paris", time(9), EUROPEAN_CLOSE, _europe_holidays()),
+    "AMS": Exchange("AMS", "Europe/Amsterdam", time(9), EUROPEAN_CLOSE, _europe_holidays()),
+    "BRU": Exchange("BRU", "Europe/Brussels", time(9), EUROPEAN_CLOSE, _europe_holidays()),
+    "LIS": Exchange("LIS", "Europe/Lisbon", time(8), time(16, 30), _europe_holidays()),
+    "DUB": Exchange("DUB", "Europe/Dublin", time(8), time(16, 30), _europe_holidays()),
+    "VIE": Exchange("VIE", "Europe/Vienna", time(9), EUROPEAN_CLOSE,
+                    _europe_holidays((12, 24), (12, 31))),
+}
+
+# Yahoo Finance suffix -> exchange
+SUFFIX_EXCHANGES = {
+    "MC": "BME", "DE": "XETRA", "F": "FRA", "MI": "MIL", "PA": "PAR", "AS": "AMS", "BR": "BRU",
+    "LS": "LIS", "IR": "DUB", "VI": "VIE", "L": "LSE", "TO": "TSX",
+}
+
+INDEX_EXCHANGES = {
+    "^IBEX": "BME", "^GDAXI": "XETRA", "^FCHI": "PAR", "^AEX": "AMS", "^FTSE": "LSE",
+    "^FTSEMIB": "MIL", "^GSPTSE": "TSX", "^STOXX50E": "XETRA",
+}
+
+
+def exchange_for(symbol):
+    """Bolsa del símbolo, o None si cotiza 24/7 (cripto) o no la conocemos"""
+    symbol = symbol.upper()
+    if is_crypto(symbol) or "=" in symbol:
+        # Crypto, FX (EURUSD=X) and futures (GC=F) trade around the clock
+        return None
+    if symbol.startswith("^"):
+        return EXCHANGES[INDEX_EXCHANGES.get(symbol, "NYSE")]
+    if "." not in symbol:
+        return EXCHANGES["NYSE"]
+    code = SUFFIX_EXCHANGES.get(symbol.rsplit(".", 1)[1])
+    return EXCHANGES[code] if code else None
+
+
+def is_open(symbol, now=None):
+    exchange = exchange_for(symbol)
+    if exchange is None:
+        return True
+    return exchange.is_open(now or datetime.now(timezone.utc))
+
+
+def market_ttl(symbol, open_ttl, now=None):
+    """TTL de un dato que cambia con el mercado: open_ttl en sesión, hasta la apertura si está cerrado"""
+    exchange = exchange_for(symbol)
+    now = now or datetime.now(timezone.utc)
+    if exchange is None or exchange.is_open(now):
+        return open_ttl
+    until_open = (exchange.next_open(now) - now).total_seconds()
+    return max(open_ttl, min(until_open, MAX_CLOSED_TTL))
+
+
+def session_ttl(symbol, day, open_ttl, now=None):
+    """TTL del cierre de un día concreto: fijo si esa sesión ya terminó, si no como market_ttl"""
+    exchange = exchange_for(symbol)
+    now = now or datetime.now(timezone.utc)
+    if exchange is None:
+        closed = day < now.date()
+    else:
+        closed = exchange.session_closed(day, now)
+    return CLOSED_SESSION_TTL if closed else market_ttl(symbol, open_ttl, now)
@@ -0,0 +1,211 @@
+"""
+Observabilidad de BolsaIA: métricas Prometheus, spans de upstream y logs estructurados.
+
+Todo lo que se mide aquí es barato (contadores e histogramas en memoria),
+así que se deja activo en producción. Las métricas se exponen en /metrics.
+"""
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import Response
+
+
+# --- Logs estructurados ---
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por evento, con los campos extra pasados en `extra=`"""
+
+    RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+    def format(self, record):
+        payload = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in self.RESERVED:
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def setup_logging():
+    root = logging.getLogger("bolsaia")
+    if root.handlers:
+        return root
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter())
+    root.addHandler(handler)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    root.propagate = False
+    return root
+
+
+def get_logger(name):
+    setup_logging()
+    return logging.getLogger(f"bolsaia.{name}")
+
+
+log = get_logger("http")
+
+
+# --- Métricas ---
+
+# Buckets pensados para llamadas HTTP externas (de 5ms a 30s)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUEST_LATENCY = Histogram(
+    "bolsaia_request_duration_seconds",
+    "Latencia de las peticiones HTTP por ruta",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "bolsaia_requests_in_flight",
+    "Peticiones HTTP en curso",
+    multiprocess_mode="livesum",
+)
+UPSTREAM_LATENCY = Histogram(
+    "bolsaia_upstream_duration_seconds",
+    "Latencia de las llamadas a servicios externos",
+    ["upstream", "operation"],
+    buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_ERRORS = Counter(
+    "bolsaia_upstream_errors_total",
+    "Errores en llamadas a servicios externos",
+    ["upstream", "operation", "error"],
+)
+CACHE_REQUESTS = Counter(
+    "bolsaia_cache_requests_total",
+    "Consultas a caché por resultado (hit/miss)",
+    ["cache", "result"],
+)
+CACHE_BYTES = Gauge(
+    "bolsaia_cache_bytes",
+    "Tamaño de la caché: estimado en memoria, bytes serializados en SQLite (no se mide con Redis)",
+    # The SQLite file is shared: every worker reports the same total
+    multiprocess_mode="livemax",
+)
+CACHE_EVICTIONS = Counter(
+    "bolsaia_cache_evictions_total",
+    "Entradas sacadas de la caché (memoria o SQLite) por espacio de nombres y motivo (budget, entries, too_large)",
+    ["cache", "reason"],
+)
+UPSTREAM_BREAKER_STATE = Gauge(
+    "bolsaia_upstream_circuit_state",
+    "Estado del circuit breaker por upstream (0=closed, 1=half_open, 2=open)",
+    ["upstream"],
+    multiprocess_mode="livemax",
+)
+UPSTREAM_REJECTED = Counter(
+    "bolsaia_upstream_rejected_total",
+    "Llamadas no realizadas por breaker abierto o rate limit",
+    ["upstream", "reason"],
+)
+STALE_SERVED = Counter(
+    "bolsaia_stale_served_total",
+    "Respuestas servidas con el último valor bueno por fallo del upstream",
+    ["upstream"],
+)
+
+PREFETCH_RUNS = Counter(
+    "bolsaia_prefetch_runs_total",
+    "Refrescos en segundo plano por tipo de dato y resultado",
+    ["kind", "result"],
+)
+JOBS = Counter(
+    "bolsaia_jobs_total",
+    "Trabajos en segundo plano por tipo y resultado (submitted, reused, rejected, done, failed)",
+    ["kind", "result"],
+)
+JOBS_QUEUED = Gauge(
+    "bolsaia_jobs_queued",
+    "Trabajos en cola pendientes de un worker",
+    multiprocess_mode="livesum",
+)
+JOB_DURATION = Histogram(
+    "bolsaia_job_duration_seconds",
+    "Tiempo de los trabajos en cola (wait) y en ejecución (run)",
+    ["kind", "phase"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+@contextmanager
+def span(upstream, operation):
+    """
+    Mide una llamada a un servicio externo (yfinance, Finviz, CNN, Gemini...).
+    Registra la latencia siempre y cuenta el error si se lanza una excepción.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        UPSTREAM_ERRORS.labels(upstream, operation, type(e).__name__).inc()
+        raise
+    finally:
+        UPSTREAM_LATENCY.labels(upstream, operation).observe(time.perf_counter() - start)
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+class MetricsMiddleware(BaseHTTPMiddleware):
+    """Mide cada petición HTTP y registra una línea de log por petición"""
+
+    async def dispatch(self, request, call_next):
+        if request.url.path == "/metrics":
+            return await call_next(request)
+
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_FLIGHT.dec()
+            # Use the route template (/api/quote/{symbol}) to keep label cardinality bounded
+            route = request.scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            REQUEST_LATENCY.labels(request.method, route_path, str(status)).observe(elapsed)
+            log.info(
+                "request",
+                extra={
+                    "method": request.method,
+                    "route": route_path,
+                    "path": request.url.path,
+                    "status": status,
+                    "duration_ms": round(elapsed * 1000, 1),
+                },
+            )
+
+
+def metrics_response():
+    # With several uvicorn workers each process writes its metrics to PROMETHEUS_MULTIPROC_DIR
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import CollectorRegistry, multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,214 @@
+"""
+Prefetch en segundo plano de los símbolos "calientes".
+
+El registro aprende los símbolos de las carteras (load_portfolios) y de las peticiones
+recientes (/api/quotes, /api/quote, /api/chart...). El scheduler refresca cada tipo de
+dato con su propia cadencia, algo menor que el TTL de la caché, para que las peticiones
+de los usuarios casi siempre encuentren el dato fresco.
+
+Para no provocar ráfagas ni gastar el presupuesto de los upstreams:
+  - cada tarea arranca con un desfase aleatorio y se reprograma con jitter,
+  - todo el prefetch comparte un token bucket propio (PREFETCH_RATE llamadas/s),
+  - se salta el upstream si su circuit breaker no está cerrado,
+  - con una cola de trabajos (jobs), los refrescos van con prioridad PREFETCH y ceden
+    los workers a las peticiones de los usuarios,
+  - los datos de mercado solo se refrescan con la bolsa del símbolo abierta (market_hours),
+  - con varios workers, un lock en la caché compartida evita que dos workers
+    refresquen el mismo dato en el mismo periodo.
+"""
+import heapq
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import get_cache
+from jobs import PREFETCH, QueueFull
+from market_hours import is_open
+from observability import PREFETCH_RUNS, get_logger
+from resilience import CircuitBreaker, TokenBucket, upstream
+
+log = get_logger("prefetch")
+
+# Símbolos vistos en peticiones se consideran calientes durante este tiempo
+HOT_TTL = 2 * 3600
+MAX_HOT_SYMBOLS = 300
+
+
+class SymbolRegistry:
+    """Símbolos calientes: los de las carteras (siempre) y los pedidos recientemente"""
+
+    def __init__(self, hot_ttl=HOT_TTL, max_symbols=MAX_HOT_SYMBOLS):
+        self.hot_ttl = hot_ttl
+        self.max_symbols = max_symbols
+        self._requested = {}  # symbol -> last seen (time.time())
+        self._portfolio = set()
+        self._lock = threading.Lock()
+
+    def touch(self, symbols):
+        now = time.time()
+        with self._lock:
+            for symbol in symbols:
+                if symbol:
+                    self._requested[symbol.upper()] = now
+            if len(self._requested) > self.max_symbols:
+                # Drop the least recently seen
+                keep = sorted(self._requested.items(), key=lambda item: item[1], reverse=True)
+                self._requested = dict(keep[:self.max_symbols])
+
+    def set_portfolio_symbols(self, symbols):
+        with self._lock:
+            self._portfolio = {s.upper() for s in symbols if s}
+
+    def hot_symbols(self):
+        cutoff = time.time() - self.hot_ttl
+        with self._lock:
+            self._requested = {s: t for s, t in self._requested.items() if t >= cutoff}
+            return self._portfolio | set(self._requested)
+
+
+def portfolio_symbols(portfolios):
+    return [
+        holding.get("symbol")
+        for portfolio in portfolios or []
+        for holding in portfolio.get("holdings", [])
+    ]
+
+
+class PrefetchTask:
+    def __init__(self, kind, cadence, upstream_name, refresh, market_hours_only=True):
+        self.kind = kind
+        self.cadence = cadence
+        self.upstream_name = upstream_name
+        self.refresh = refresh
+        self.market_hours_only = market_hours_only
+
+
+class PrefetchScheduler:
+    """Planificador de refrescos por (tipo de dato, símbolo) en un hilo propio"""
+
+    def __init__(self, registry, rate=None, workers=2, jitter=0.1, portfolio_loader=None,
+                 portfolio_refresh=300, jobs=None):
+        rate = rate if rate is not None else float(os.getenv("PREFETCH_RATE", "2"))
+        worker_count = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+        self.registry = registry
+        self.budget = TokenBucket(rate / worker_count, max(1, 5 // worker_count))
+        self.jitter = jitter
+        self.portfolio_loader = portfolio_loader
+        self.portfolio_refresh = portfolio_refresh
+        # With a job queue the refreshes share its workers at PREFETCH priority
+        self.jobs = jobs
+        self.tasks = {}
+        self._queue = []  # heap of (due, kind, symbol)
+        self._scheduled = set()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def register(self, kind, cadence, upstream_name, refresh, market_hours_only=True):
+        self.tasks[kind] = PrefetchTask(kind, cadence, upstream_name, refresh, market_hours_only)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="prefetch-scheduler", daemon=True)
+        self._thread.start()
+        log.info("Prefetch scheduler started", extra={"tasks": list(self.tasks)})
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        self._pool.shutdown(wait=False)
+
+    def _jittered(self, cadence):
+        return cadence * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _sync_symbols(self):
+        """Programa las tareas de los símbolos nuevos, repartidas a lo largo de su cadencia"""
+        now = time.time()
+        for symbol in self.registry.hot_symbols():
+            for kind, task in self.tasks.items():
+                if (kind, symbol) not in self._scheduled:
+                    self._scheduled.add((kind, symbol))
+                    heapq.heappush(self._queue, (now + random.uniform(0, task.cadence), kind, symbol))
+
+    def _load_portfolios(self):
+        if self.portfolio_loader is None:
+            return
+        try:
+            self.registry.set_portfolio_symbols(portfolio_symbols(self.portfolio_loader()))
+        except Exception as e:
+            log.warning("Could not load portfolio symbols", extra={"error": str(e)})
+
+    def _run(self):
+        next_portfolio_load = 0.0
+        while not self._stop.is_set():
+            now = time.time()
+            if now >= next_portfolio_load:
+                self._load_portfolios()
+                next_portfolio_load = now + self.portfolio_refresh
+            self._sync_symbols()
+
+            if not self._queue or self._queue[0][0] > now:
+                wait = min(self._queue[0][0] - now if self._queue else 5.0, 5.0)
+                self._wakeup.wait(max(wait, 0.05))
+                self._wakeup.clear()
+                continue
+
+            due, kind, symbol = heapq.heappop(self._queue)
+            task = self.tasks[kind]
+            if symbol not in self.registry.hot_symbols():
+                # Cooled down: forget it until it is requested again
+                self._scheduled.discard((kind, symbol))
+                continue
+
+            if not self._ready(task, symbol):
+                heapq.heappush(self._queue, (now + self._jittered(task.cadence), kind, symbol))
+                continue
+            wait = self.budget.try_acquire()
+            if wait > 0:
+                # Over budget: retry this one as soon as there is a token
+                heapq.heappush(self._queue, (now + wait, kind, symbol))
+                continue
+
+            heapq.heappush(self._queue, (now + self._jittered(task.cadence), kind, symbol))
+            self._dispatch(task, symbol)
+
+    def _ready(self, task, symbol):
+        if task.market_hours_only and not is_open(symbol):
+            PREFETCH_RUNS.labels(task.kind, "market_closed").inc()
+            return False
+        if upstream(task.upstream_name).breaker.state != CircuitBreaker.CLOSED:
+            PREFETCH_RUNS.labels(task.kind, "upstream_degraded").inc()
+            return False
+        return True
+
+    def _dispatch(self, task, symbol):
+        if self.jobs is None:
+            self._pool.submit(self._execute, task, symbol)
+            return
+        try:
+            self.jobs.submit(f"prefetch_{task.kind}", f"prefetch:{task.kind}:{symbol}", self._execute,
+                             task, symbol, priority=PREFETCH, ttl=0)
+        except QueueFull:
+            PREFETCH_RUNS.labels(task.kind, "queue_full").inc()
+
+    def _execute(self, task, symbol):
+        """Refresca un dato. Devuelve (None, False) para poder ejecutarse como trabajo de la cola"""
+        # Only one worker refreshes a given (kind, symbol) per period: the lock expires on its own
+        token = get_cache().acquire_lock(f"prefetch:{task.kind}:{symbol}", ttl=task.cadence * 0.9)
+        if token is None:
+            PREFETCH_RUNS.labels(task.kind, "other_worker").inc()
+            return None, False
+        try:
+            task.refresh(symbol)
+            PREFETCH_RUNS.labels(task.kind, "ok").inc()
+        except Exception as e:
+            PREFETCH_RUNS.labels(task.kind, "error").inc()
+            log.warning("Prefetch failed", extra={"kind": task.kind, "symbol": symbol, "error": str(e)})
+        return None, False
+
+
+registry = SymbolRegistry()
@@ -0,0 +1,352 @@
+"""
+Capa de resiliencia para los servicios externos (Yahoo, Finviz, CNN, Gemini...).
+
+Cada upstream tiene:
+  - un token bucket adaptativo (reduce el ritmo cuando nos limitan con 429),
+  - un circuit breaker que se abre por tasa de errores o de llamadas lentas,
+  - reintentos con backoff exponencial y jitter,
+  - el último valor bueno por clave, que se sirve marcado como `stale` si el upstream falla.
+
+Uso:
+    value, stale = upstream("yfinance").call(f"quote:{symbol}", fetch_quote, symbol)
+    value, stale = cached_call("quotes", symbol, 30, "yfinance", fetch_quote, symbol)
+"""
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+
+from cache import CacheStore, get_cache, get_or_load
+from observability import (
+    STALE_SERVED,
+    UPSTREAM_BREAKER_STATE,
+    UPSTREAM_REJECTED,
+    get_logger,
+    span,
+)
+
+log = get_logger("resilience")
+
+
+class UpstreamUnavailable(Exception):
+    """El upstream falló (o está bloqueado) y no hay ningún valor anterior que servir"""
+
+
+class NoData(Exception):
+    """El upstream respondió bien pero no tiene datos (símbolo inválido). No cuenta como fallo"""
+
+
+class EmptyResponse(Exception):
+    """Respuesta vacía donde tenía que haber datos (un error que el cliente se calló). Cuenta como fallo"""
+
+
+try:
+    # YFTickerMissingError covers YFPricesMissingError and YFTzMissingError
+    from yfinance.exceptions import YFInvalidPeriodError, YFTickerMissingError
+except ImportError:  # yfinance versions without typed exceptions
+    CLIENT_ERRORS = (NoData,)
+else:
+    CLIENT_ERRORS = (NoData, YFInvalidPeriodError, YFTickerMissingError)
+
+
+def is_throttle_error(error):
+    """Detecta respuestas de rate limit (HTTP 429 o YFRateLimitError)"""
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if status == 429:
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return "429" in text or "too many requests" in text or "ratelimit" in text or "rate limit" in text
+
+
+def is_client_error(error):
+    """
+    Errores del lado de la petición (símbolo o periodo inválido, HTTP 4xx salvo 408/429):
+    ni se reintentan ni abren el breaker. Se distinguen por tipo, no por el texto.
+    """
+    if isinstance(error, CLIENT_ERRORS):
+        return True
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status is not None and 400 <= status < 500 and status not in (408, 429)
+
+
+class TokenBucket:
+    """
+    Token bucket con ajuste AIMD: cada throttle divide el ritmo a la mitad y cada
+    éxito lo recupera poco a poco hasta el máximo configurado.
+    """
+
+    def __init__(self, rate, capacity, min_rate=None, clock=time.monotonic):
+        self.max_rate = float(rate)
+        self.min_rate = float(min_rate) if min_rate else self.max_rate / 16
+        self.rate = self.max_rate
+        self.capacity = float(capacity)
+        self.tokens = self.capacity
+        self._clock = clock
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """Devuelve 0 si hay token o los segundos a esperar hasta el siguiente"""
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self, max_wait):
+        deadline = self._clock() + max_wait
+        while True:
+            wait = self.try_acquire()
+            if wait == 0:
+                return True
+            if self._clock() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def throttle(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+
+    def recover(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+class CircuitBreaker:
+    """
+    Breaker clásico closed -> open -> half_open. Se abre cuando, con al menos
+    `min_calls` en la ventana, la proporción de errores o de llamadas lentas
+    supera el umbral. Tras `cooldown` segundos deja pasar una llamada de prueba.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name, failure_ratio=0.5, slow_ratio=0.8, slow_call_seconds=5.0,
+                 window=20, min_calls=5, cooldown=30.0, clock=time.monotonic):
+        self.name = name
+        self.failure_ratio = failure_ratio
+        self.slow_ratio = slow_ratio
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self._calls = deque(maxlen=window)  # (failed, slow)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._publish()
+
+    def _publish(self):
+        UPSTREAM_BREAKER_STATE.labels(self.name).set(self.STATE_VALUES[self.state])
+
+    def _transition(self, state):
+        if state != self.state:
+            log.warning("Circuit breaker transition",
+                        extra={"upstream": self.name, "from_state": self.state, "to_state": state})
+            self.state = state
+            self._publish()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self._clock() - self._opened_at >= self.cooldown:
+                self._transition(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def release_probe(self):
+        """Libera la llamada de prueba si no llegó a ejecutarse (p.ej. por rate limit)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record(self, failed, duration):
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+                if failed or slow:
+                    self._open()
+                else:
+                    self._calls.clear()
+                    self._transition(self.CLOSED)
+                return
+
+            self._calls.append((failed, slow))
+            if len(self._calls) < self.min_calls:
+                return
+            failures = sum(1 for f, _ in self._calls if f)
+            slows = sum(1 for _, s in self._calls if s)
+            if failures / len(self._calls) >= self.failure_ratio or slows / len(self._calls) >= self.slow_ratio:
+                self._open()
+
+    def _open(self):
+        self._opened_at = self._clock()
+        self._calls.clear()
+        self._transition(self.OPEN)
+
+
+class LastGoodStore:
+    """Último valor bueno por clave (LRU acotado) para servir datos `stale`"""
+
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None, False
+            self._data.move_to_end(key)
+            return self._data[key], True
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+class Upstream:
+    """Cliente resiliente para un servicio externo"""
+
+    def __init__(self, name, rate, burst, retries=1, max_wait=2.0, backoff=0.2,
+                 breaker=None, store=None):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = breaker or CircuitBreaker(name)
+        self.retries = retries
+        self.max_wait = max_wait
+        self.backoff = backoff
+        self.store = store if store is not None else LastGoodStore()
+
+    def _fallback(self, key, reason, error=None):
+        if key is not None:
+            value, found = self.store.get(key)
+            if found:
+                STALE_SERVED.labels(self.name).inc()
+                log.info("Serving stale value",
+                         extra={"upstream": self.name, "key": key, "reason": reason})
+                return value, True
+        raise UpstreamUnavailable(f"{self.name} unavailable ({reason})") from error
+
+    def call(self, key, fn, *args, operation="call", **kwargs):
+        """
+        Ejecuta fn(*args, **kwargs) protegido. Devuelve (valor, stale).
+        Con key=None no se guarda ni se sirve ningún valor anterior.
+        """
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                UPSTREAM_REJECTED.labels(self.name, "circuit_open").inc()
+                return self._fallback(key, "circuit_open", last_error)
+            if not self.bucket.acquire(self.max_wait):
+                UPSTREAM_REJECTED.labels(self.name, "rate_limited").inc()
+                self.breaker.release_probe()
+                return self._fallback(key, "rate_limited", last_error)
+
+            start = time.monotonic()
+            try:
+                with span(self.name, operation):
+                    value = fn(*args, **kwargs)
+            except Exception as e:
+                if is_client_error(e):
+                    self.breaker.record(False, time.monotonic() - start)
+                    raise
+                self.breaker.record(True, time.monotonic() - start)
+                last_error = e
+                if is_throttle_error(e):
+                    self.bucket.throttle()
+                log.warning("Upstream call failed",
+                            extra={"upstream": self.name, "key": key, "attempt": attempt, "error": str(e)})
+                if attempt < self.retries:
+                    # Full jitter exponential backoff
+                    time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+                continue
+
+            self.breaker.record(False, time.monotonic() - start)
+            self.bucket.recover()
+            if key is not None:
+                self.store.set(key, value)
+            return value, False
+
+        return self._fallback(key, "error", last_error)
+
+
+# Límites por upstream: (peticiones/s, ráfaga, reintentos, segundos para considerar lenta una llamada)
+UPSTREAM_LIMITS = {
+    "yfinance": (20, 40, 1, 8.0),
+    "yahoo_search": (5, 10, 1, 5.0),
+    "finviz": (1, 3, 1, 8.0),
+    "cnn": (0.5, 2, 1, 5.0),
+    "aaii": (0.2, 1, 0, 5.0),
+    "gemini": (0.5, 2, 0, 20.0),
+    "translator": (5, 10, 0, 3.0),
+    "supabase": (10, 20, 1, 5.0),
+}
+
+# Los últimos valores buenos se guardan en la caché compartida para que cualquier worker pueda servirlos
+LAST_GOOD_RETENTION = 24 * 3600
+
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+
+
+def upstream(name):
+    """Devuelve (creándolo si hace falta) el cliente resiliente de un upstream"""
+    with _upstreams_lock:
+        if name not in _upstreams:
+            rate, burst, retries, slow = UPSTREAM_LIMITS.get(name, (5, 10, 1, 5.0))
+            # Each worker gets its share of the budget so N workers don't multiply upstream traffic
+            workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+            _upstreams[name] = Upstream(
+                name, rate / workers, max(1, burst // workers), retries=retries,
+                breaker=CircuitBreaker(name, slow_call_seconds=slow),
+                store=CacheStore(f"lastgood:{name}:", LAST_GOOD_RETENTION),
+            )
+        return _upstreams[name]
+
+
+def cached_call(namespace, key, ttl, upstream_name, fn, *args, operation="call", **kwargs):
+    """
+    Caché compartida + upstream resiliente: sirve de la caché si el valor sigue fresco,
+    y si no llama al upstream una sola vez entre todos los workers. Devuelve (valor, stale).
+    """
+    def load():
+        value, stale = upstream(upstream_name).call(
+            f"{namespace}:{key}", fn, *args, operation=operation, **kwargs)
+        return (value, stale), not stale
+
+    (value, stale), _ = get_or_load(namespace, key, ttl, load)
+    return value, stale
+
+
+def refresh_cached(namespace, key, ttl, upstream_name, fn, *args, operation="call", **kwargs):
+    """Fuerza la recarga de una entrada de la caché (prefetch). Los valores stale no se guardan"""
+    value, stale = upstream(upstream_name).call(
+        f"{namespace}:{key}", fn, *args, operation=operation, **kwargs)
+    if not stale:
+        # Same layout cached_call stores: (value, stale)
+        get_cache().set(f"{namespace}:{key}", (value, False), ttl)
+    return value, stale
+
+
+def reset_upstreams():
+    """Olvida todo el estado (breakers, buckets, valores stale). Útil en tests y benchmarks"""
+    with _upstreams_lock:
+        _upstreams.clear()
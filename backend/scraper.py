@@ -1,39 +1,94 @@
 import requests
 from bs4 import BeautifulSoup
 
+from observability import get_logger
+from resilience import upstream
+
+log = get_logger("scraper")
+
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
 }
 
-def get_finviz_news(symbol):
-    """Scrapes news headlines from Finviz for a specific symbol"""
+def fetch_finviz_news(symbol):
+    """Scrapes news headlines from Finviz. Raises on HTTP errors (403/429 when blocked)"""
     url = f"https://finviz.com/quote.ashx?t={symbol}&p=d"
-    try:
-        response = requests.get(url, headers=HEADERS)
-        soup = BeautifulSoup(response.content, "html.parser")
-        news_table = soup.find(id="news-table")
-        
-        news_items = []
-        if news_table:
-            for row in news_table.findAll("tr"):
-                link = row.a
-                timestamp = row.td.text.strip()
-                if link:
-                    news_items.append({
-                        "title": link.text,
-                        "link": link['href'],
-                        "time": timestamp
-                    })
-        return news_items[:10]  # Return top 10 news
-    except Exception as e:
-        print(f"Error scraping Finviz: {e}")
-        return []
+    response = requests.get(url, headers=HEADERS, timeout=10)
+    response.raise_for_status()
+    soup = BeautifulSoup(response.content, "html.parser")
+    news_table = soup.find(id="news-table")
+    
+    news_items = []
+    if news_table:
+        for row in news_table.findAll("tr"):
+            link = row.a
+            timestamp = row.td.text.strip()
+            if link:
+                news_items.append({
+                    "title": link.text,
+                    "link": link['href'],
+                    "time": timestamp
+                })
+    return news_items[:10]  # Return top 10 news
 
 import yfinance as yf
 import requests
 from bs4 import BeautifulSoup
 import re
 
+CNN_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Referer": "https://edition.cnn.com/",
+    "Origin": "https://edition.cnn.com"
+}
+
+def _fetch_cnn_fear_and_greed():
+    url = "https://production.dataviz.cnn.io/index/fearandgreed/graphdata"
+    r = requests.get(url, headers=CNN_HEADERS, timeout=5)
+    r.raise_for_status()
+    return r.json()
+
+def _fetch_vix():
+    vix_ticker = yf.Ticker("^VIX")
+    vix = vix_ticker.fast_info.last_price
+
+    # If fast_info fails or returns 0 (market closed/delayed), try history
+    if not vix:
+        hist = vix_ticker.history(period="1d")
+        if not hist.empty:
+            vix = hist['Close'].iloc[-1]
+    return vix
+
+def _fetch_aaii():
+    aaii_url = "https://www.aaii.com/sentimentsurvey"
+    headers_aaii = {"User-Agent": "Mozilla/5.0"}
+    r_aaii = requests.get(aaii_url, headers=headers_aaii, timeout=5)
+    r_aaii.raise_for_status()
+
+    soup = BeautifulSoup(r_aaii.content, "html.parser")
+    text = soup.get_text()
+    
+    # Look for patterns like "Bullish 42.0%" or similar structure
+    # This is fragile, but we try standard keywords
+    
+    # Placeholder for AAII data structure
+    aaii_data = {}
+    
+    # Try to find percentages associated with Sentiment
+    # Note: The browser saw "Bullish: 42.0%", let's look for that
+    bullish_match = re.search(r"Bullish.*?(\d+\.?\d*)%", text, re.IGNORECASE)
+    bearish_match = re.search(r"Bearish.*?(\d+\.?\d*)%", text, re.IGNORECASE)
+    
+    if bullish_match:
+        aaii_data["bullish"] = float(bullish_match.group(1))
+    if bearish_match:
+        aaii_data["bearish"] = float(bearish_match.group(1))
+
+    # A 200 without data is the Incapsula block page: treat it as a failure
+    if not aaii_data:
+        raise ValueError("AAII page without sentiment data (blocked?)")
+    return aaii_data
+
 def get_market_sentiment():
     """
     Fetches real market sentiment from CNN Fear & Greed API and AAII.
@@ -50,107 +105,69 @@ def get_market_sentiment():
 
     # 1. CNN Fear & Greed (Official API)
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Referer": "https://edition.cnn.com/",
-            "Origin": "https://edition.cnn.com"
+        data, stale = upstream("cnn").call("fear_and_greed", _fetch_cnn_fear_and_greed, operation="fear_and_greed")
+        fng = data['fear_and_greed']
+        score = int(fng['score'])
+        # Translate Label to Spanish
+        label_map = {
+            "Extreme Fear": "Miedo Extremo",
+            "Fear": "Miedo",
+            "Neutral": "Neutral",
+            "Greed": "Codicia",
+            "Extreme Greed": "Codicia Extrema"
         }
-        url = "https://production.dataviz.cnn.io/index/fearandgreed/graphdata"
-        r = requests.get(url, headers=headers, timeout=5)
+        spanish_index = label_map.get(data['fear_and_greed']['rating'].title(), data['fear_and_greed']['rating'])
         
-        if r.status_code == 200:
-            data = r.json()
-            fng = data['fear_and_greed']
-            score = int(fng['score'])
-            # Translate Label to Spanish
-            label_map = {
-                "Extreme Fear": "Miedo Extremo",
-                "Fear": "Miedo",
-                "Neutral": "Neutral",
-                "Greed": "Codicia",
-                "Extreme Greed": "Codicia Extrema"
-            }
-            spanish_index = label_map.get(data['fear_and_greed']['rating'].title(), data['fear_and_greed']['rating'])
-            
-            sentiment_data.update({
-                "value": score,
-                "index": spanish_index,
-                "summary": f"Índice de Miedo y Codicia: {score} ({spanish_index})",
-                "timestamp": fng['timestamp']
-            })
-            
-            # Map Color
-            if score < 25: sentiment_data["color"] = "red"
-            elif score < 45: sentiment_data["color"] = "orange"
-            elif score < 55: sentiment_data["color"] = "gray"
-            elif score < 75: sentiment_data["color"] = "blue"
-            else: sentiment_data["color"] = "green"
-            
-            sentiment_data["sources"].append("CNN Money")
+        sentiment_data.update({
+            "value": score,
+            "index": spanish_index,
+            "summary": f"Índice de Miedo y Codicia: {score} ({spanish_index})",
+            "timestamp": fng['timestamp']
+        })
+        if stale:
+            sentiment_data["stale"] = True
+        
+        # Map Color
+        if score < 25: sentiment_data["color"] = "red"
+        elif score < 45: sentiment_data["color"] = "orange"
+        elif score < 55: sentiment_data["color"] = "gray"
+        elif score < 75: sentiment_data["color"] = "blue"
+        else: sentiment_data["color"] = "green"
+        
+        sentiment_data["sources"].append("CNN Money")
+        cnn_ok = True
             
     except Exception as e:
-        print(f"CNN Scraping Error: {e}")
-        # FALLBACK for sentiment score if CNN fails
-        try:
-             vix = yf.Ticker("^VIX").fast_info.last_price
-             sentiment_data["vix"] = round(vix, 2)
-             if vix > 30: sentiment_data.update({"value": 20, "index": "Fear", "color": "red"})
-             elif vix < 15: sentiment_data.update({"value": 80, "index": "Greed", "color": "green"})
-             sentiment_data["summary"] = "Estimado vía VIX (CNN no disponible)"
-        except:
-             pass
+        log.error("CNN scraping error", extra={"error": str(e)})
+        cnn_ok = False
 
     # ALWAYS fetch VIX for display (Yahoo Finance)
     try:
-         vix_ticker = yf.Ticker("^VIX")
-         vix = vix_ticker.fast_info.last_price
-         
-         # If fast_info fails or returns 0 (market closed/delayed), try history
-         if not vix:
-             hist = vix_ticker.history(period="1d")
-             if not hist.empty:
-                 vix = hist['Close'].iloc[-1]
-
-         if vix:
+        vix, stale = upstream("yfinance").call("vix", _fetch_vix, operation="vix")
+
+        if vix:
             sentiment_data["vix"] = round(vix, 2)
-            print(f"DEBUG: VIX updated via Yahoo Finance: {sentiment_data['vix']}")
-         else:
-            print("DEBUG: VIX fetch returned None/0")
+            log.debug("VIX updated via Yahoo Finance", extra={"vix": sentiment_data['vix']})
+            # FALLBACK for sentiment score if CNN fails
+            if not cnn_ok:
+                if vix > 30: sentiment_data.update({"value": 20, "index": "Fear", "color": "red"})
+                elif vix < 15: sentiment_data.update({"value": 80, "index": "Greed", "color": "green"})
+                sentiment_data["summary"] = "Estimado vía VIX (CNN no disponible)"
+                if stale:
+                    sentiment_data["stale"] = True
+        else:
+            log.debug("VIX fetch returned None/0")
             
     except Exception as e:
-        print(f"VIX Fetch Error: {e}")
+        log.error("VIX fetch error", extra={"error": str(e)})
 
     # 2. AAII Sentiment (Best Effort)
     try:
-        aaii_url = "https://www.aaii.com/sentimentsurvey"
-        headers_aaii = {"User-Agent": "Mozilla/5.0"}
-        r_aaii = requests.get(aaii_url, headers=headers_aaii, timeout=5)
-        
-        if r_aaii.status_code == 200:
-            soup = BeautifulSoup(r_aaii.content, "html.parser")
-            text = soup.get_text()
-            
-            # Look for patterns like "Bullish 42.0%" or similar structure
-            # This is fragile, but we try standard keywords
-            
-            # Placeholder for AAII data structure
-            aaii_data = {}
-            
-            # Try to find percentages associated with Sentiment
-            # Note: The browser saw "Bullish: 42.0%", let's look for that
-            bullish_match = re.search(r"Bullish.*?(\d+\.?\d*)%", text, re.IGNORECASE)
-            bearish_match = re.search(r"Bearish.*?(\d+\.?\d*)%", text, re.IGNORECASE)
-            
-            if bullish_match:
-                aaii_data["bullish"] = float(bullish_match.group(1))
-            if bearish_match:
-                aaii_data["bearish"] = float(bearish_match.group(1))
-                
-            if aaii_data:
-                sentiment_data["aaii"] = aaii_data
-                sentiment_data["sources"].append("AAII")
+        aaii_data, _ = upstream("aaii").call("sentiment_survey", _fetch_aaii, operation="sentiment_survey")
+        sentiment_data["aaii"] = aaii_data
+        sentiment_data["sources"].append("AAII")
                 
     except Exception as e:
-        print(f"AAII Scraping Error: {e}")
+        log.error("AAII scraping error", extra={"error": str(e)})
 
     return sentiment_data
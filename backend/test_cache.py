@@ -0,0 +1,128 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Add current directory to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+from prometheus_client import REGISTRY
+
+from cache import MemoryCache, SQLiteCache, get_or_load, set_cache
+from frames import compact_frame, widen
+
+
+def test_memory_cache_expires_entries():
+    cache = MemoryCache()
+    cache.set("a", None, ttl=0.05)
+    assert cache.get("a") == (None, True)
+    time.sleep(0.06)
+    assert cache.get("a") == (None, False)
+
+
+def test_sqlite_cache_is_shared_between_instances():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache.sqlite3")
+        worker_a, worker_b = SQLiteCache(path), SQLiteCache(path)
+        worker_a.set("quotes:AAPL", {"price": 228.5}, ttl=30)
+        assert worker_b.get("quotes:AAPL") == ({"price": 228.5}, True)
+
+        token = worker_a.acquire_lock("quotes:AAPL", ttl=30)
+        assert token is not None
+        assert worker_b.acquire_lock("quotes:AAPL", ttl=30) is None
+        worker_a.release_lock("quotes:AAPL", token)
+        assert worker_b.acquire_lock("quotes:AAPL", ttl=30) is not None
+
+
+def test_get_or_load_is_single_flight():
+    with tempfile.TemporaryDirectory() as tmp:
+        set_cache(SQLiteCache(os.path.join(tmp, "cache.sqlite3")))
+        calls = []
+
+        def loader():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"price": 1}, True
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(get_or_load("quotes", "AAPL", 30, loader)))
+            for _ in range(8)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(calls) == 1
+        assert all(value == {"price": 1} for value, _ in results)
+        set_cache(MemoryCache())
+
+
+def _yfinance_history(days):
+    """Full daily history as yfinance returns it: float64, extra columns, tz-aware index"""
+    index = pd.date_range("1985-01-01", periods=days, freq="B", tz="America/New_York")
+    close = 100 + np.cumsum(np.random.default_rng(0).normal(0, 1, days))
+    return pd.DataFrame({
+        "Open": close, "High": close + 1, "Low": close - 1, "Close": close,
+        "Volume": np.full(days, 35_000_000, dtype=np.int64),
+        "Dividends": 0.0, "Stock Splits": 0.0,
+    }, index=index)
+
+
+def test_memory_cache_holds_500_full_histories_under_200mb():
+    history = _yfinance_history(10000)
+    bars = compact_frame(history, ["Open", "High", "Low", "Close", "Volume"])
+    assert bars.index.tz is None
+    assert bars["Close"].dtype == np.float32 and bars["Volume"].dtype == np.uint32
+    assert abs(widen(bars["Close"]) - history["Close"].to_numpy()).max() < 1e-3
+
+    budget = 200 * 1024 * 1024
+    cache = MemoryCache(max_bytes=budget)
+    for i in range(500):
+        frame = bars.copy()
+        cache.set(f"bars:S{i}:max:1d", (frame, False), ttl=900)
+        # The last good copy shares the frame: counted once
+        cache.set(f"lastgood:yfinance:bars:S{i}:max:1d", frame, ttl=86400)
+    assert cache.get("bars:S0:max:1d")[1]
+    assert cache.total_bytes < budget
+    assert cache.total_bytes < 500 * history.memory_usage().sum() / 2
+
+
+def test_memory_cache_evicts_by_size():
+    def evicted():
+        return REGISTRY.get_sample_value(
+            "bolsaia_cache_evictions_total", {"cache": "bars", "reason": "budget"}) or 0
+
+    before = evicted()
+    frame_bytes = np.zeros(1000, dtype=np.float64).nbytes
+    cache = MemoryCache(max_bytes=3 * frame_bytes + 2000)
+    for i in range(4):
+        cache.set(f"bars:{i}", np.zeros(1000), ttl=60)
+    assert cache.get("bars:0") == (None, False)
+    assert cache.get("bars:3")[1]
+    assert evicted() == before + 1
+
+    cache.delete("bars:3")
+    cache.set("bars:huge", np.zeros(100_000), ttl=60)
+    assert cache.get("bars:huge") == (None, False)
+    assert cache.get("bars:2")[1]
+
+
+def test_sqlite_cache_evicts_oldest_over_budget():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = SQLiteCache(os.path.join(tmp, "cache.sqlite3"), max_bytes=30_000)
+        for i in range(4):
+            cache.set(f"bars:{i}", np.zeros(1000), ttl=60)
+        # Rewriting an entry makes it the newest one
+        cache.set("bars:0", np.zeros(1000), ttl=60)
+        cache.purge()
+        assert cache.get("bars:1") == (None, False)
+        assert cache.get("bars:0")[1] and cache.get("bars:3")[1]
+        assert REGISTRY.get_sample_value("bolsaia_cache_bytes") <= 30_000
+
+        cache.set("bars:huge", np.zeros(10_000), ttl=60)
+        assert cache.get("bars:huge") == (None, False)
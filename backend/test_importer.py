@@ -0,0 +1,115 @@
+import io
+import os
+import sys
+import time
+
+# Add current directory to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.testclient import TestClient
+
+import main
+from bench.stubs import Stubs, UpstreamProfile
+from cache import MemoryCache, set_cache
+from importer import import_holdings, parse_number, pick_listing
+from resilience import reset_upstreams
+
+DEGIRO_HEADER = (
+    "Fecha,Hora,Producto,ISIN,Bolsa de referencia,Centro de ejecución,Número,Precio,,Valor local,,"
+    "Valor,,Tipo de cambio,Costes de transacción y/o externos,,Total,,ID Orden\n")
+
+IBKR_STATEMENT = """Statement,Header,Field Name,Field Value
+Statement,Data,Title,Activity Statement
+Trades,Header,DataDiscriminator,Asset Category,Currency,Symbol,Date/Time,Quantity,T. Price,C. Price,Proceeds,Comm/Fee
+Trades,Data,Order,Stocks,USD,AAPL,"2024-01-05, 10:30:00","1,000",185.5,186,-185500,-1
+Trades,Data,Order,Stocks,USD,MSFT,"2024-01-08, 15:00:00",-5,370,371,1850,-1
+Trades,Data,Order,Forex,USD,EUR.USD,"2024-01-09, 09:00:00","10,000",1.095,1.096,-10950,-2
+Trades,Data,Order,Equity and Index Options,USD,AAPL 19JAN24 190 C,"2024-01-10, 11:00:00",1,3.5,3.6,-350,-1
+Trades,SubTotal,,Stocks,USD,AAPL,,1000,,,-185500,-1
+"""
+
+
+def degiro_rows(count):
+    for i in range(count):
+        day = 1 + i % 28
+        if i % 3 == 0:
+            yield f"{day:02d}-03-2024,10:00,BANCO SANTANDER,ES0113900J37,MAD,MAD,{10 + i % 7},\"4,12\",EUR,,,,,,\"-2,00\",EUR,,,\n"
+        elif i % 3 == 1:
+            # No price: filled from the symbol's history
+            yield f"{day:02d}-03-2024,10:00,ISHARES,IE00B0M62S72,XET,XET,5,,EUR,,,,,,,,,,\n"
+        else:
+            yield f"{day:02d}-03-2024,10:00,NVIDIA,,NDQ,NDQ,-3,\"800,00\",USD,,,,,,,,,,\n"
+
+
+def test_parse_number():
+    assert parse_number("4,12", decimal_comma=True) == 4.12
+    assert parse_number("1.234,56") == 1234.56
+    assert parse_number("1,000") == 1000
+    assert parse_number("-2.00 EUR") == -2.0
+    assert parse_number("") is None
+
+
+def test_pick_listing():
+    results = [{"symbol": "AAPL"}, {"symbol": "SAN.MC"}, {"symbol": "SAN"}]
+    assert pick_listing(results, "ES0113900J37", "MAD") == "SAN.MC"
+    # DEGIRO's WSE is Warsaw (.WA); Vienna is WBO (.VI)
+    listings = [{"symbol": "PKO.VI"}, {"symbol": "PKO.WA"}]
+    assert pick_listing(listings, "PLPKO0000016", "WSE") == "PKO.WA"
+    assert pick_listing(listings, "PLPKO0000016", "WBO") == "PKO.VI"
+    assert pick_listing(results[1:2], "SAN", "") == "SAN.MC"
+    assert pick_listing(results[:1], "ES0113900J37", "") == "AAPL"
+    # Search also returns lookalikes for a ticker: those are unresolved, not the first result
+    assert pick_listing(results[:1], "EUR.USD", "") is None
+
+
+def test_import_statements_in_bulk():
+    reset_upstreams()
+    set_cache(MemoryCache())
+    profiles = {"yfinance": UpstreamProfile(), "yahoo_search": UpstreamProfile()}
+    with Stubs(profiles).install(main):
+        main.save_portfolios_to_db([{"id": "p1", "name": "DEGIRO", "holdings": []}])
+        client = TestClient(main.app)
+
+        body = DEGIRO_HEADER + "".join(degiro_rows(10000))
+        start = time.time()
+        report = client.post("/api/portfolios/p1/import", content=body.encode("utf-8")).json()
+        elapsed = time.time() - start
+
+        # Sells (negative quantity) and rows without ISIN or symbol are skipped
+        assert report["imported"] == 6667
+        assert report["skipped"] == 3333
+        assert len(report["issues"]) == 100
+        # One search per ISIN and one history per symbol missing prices
+        assert profiles["yahoo_search"].calls == 2
+        assert profiles["yfinance"].calls == 1
+        assert elapsed < 10
+
+        holdings = main.load_portfolios()[0]["holdings"]
+        assert len(holdings) == 6667
+        assert {h["symbol"] for h in holdings} == {"SAN.MC", "IQQD.DE"}
+        assert holdings[0]["price"] == 4.12 and holdings[0]["fees"] == 2.0
+        assert all(h["price"] > 0 for h in holdings)
+
+        report = client.post("/api/portfolios/p1/import", content=IBKR_STATEMENT.encode("utf-8")).json()
+        assert report["imported"] == 1
+        assert main.load_portfolios()[0]["holdings"][-1]["shares"] == 1000
+
+        assert client.post("/api/portfolios/missing/import", content=b"a,b\n").status_code == 404
+        assert client.post("/api/portfolios/p1/import", content=b"a,b\n1,2\n").status_code == 400
+    reset_upstreams()
+
+
+def test_rows_without_identifier_are_skipped():
+    body = DEGIRO_HEADER + (
+        "01-03-2024,10:00,BANCO SANTANDER,ES0113900J37,MAD,MAD,10,\"4,12\",EUR,,,,,,,,,,\n"
+        "02-03-2024,10:00,SIN ISIN,,MAD,MAD,5,\"1,00\",EUR,,,,,,,,,,\n")
+    queries = []
+
+    def search(query):
+        queries.append(query)
+        return [{"symbol": "SAN.MC"}]
+
+    holdings, report = import_holdings(io.BytesIO(body.encode("utf-8")), search)
+    assert [h["symbol"] for h in holdings] == ["SAN.MC"]
+    assert report["skipped"] == 1
+    assert queries == ["ES0113900J37"]
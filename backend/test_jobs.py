@@ -0,0 +1,104 @@
+import os
+import sys
+import threading
+import time
+from unittest import mock
+
+# Add current directory to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.testclient import TestClient
+
+import main
+from bench.stubs import Stubs, UpstreamProfile
+from cache import MemoryCache, set_cache
+from jobs import DONE, INTERACTIVE, PREFETCH, QUEUED, JobQueue, QueueFull
+from resilience import reset_upstreams
+
+
+def test_queue_deduplicates_and_prioritizes():
+    set_cache(MemoryCache())
+    queue = JobQueue(workers=1, max_queued=2)
+    release = threading.Event()
+    order = []
+
+    def work(name):
+        release.wait(5)
+        order.append(name)
+        return name, True
+
+    busy = queue.submit("slow", "busy", work, "busy")
+    while queue.get(busy["id"])["status"] == QUEUED:
+        time.sleep(0.01)
+    prefetch = queue.submit("news", "prefetch", work, "prefetch", priority=PREFETCH)
+    # Prefetch may only take half of the queue: the rest is kept for users
+    try:
+        queue.submit("news", "prefetch-2", work, "prefetch-2", priority=PREFETCH)
+        assert False, "expected QueueFull"
+    except QueueFull:
+        pass
+    interactive = queue.submit("news", "interactive", work, "interactive", priority=INTERACTIVE)
+    # Same key while queued: same job
+    assert queue.submit("news", "interactive", work, "interactive")["id"] == interactive["id"]
+    assert interactive["status"] == QUEUED
+
+    try:
+        queue.submit("news", "overflow", work, "overflow")
+        assert False, "expected QueueFull"
+    except QueueFull:
+        pass
+
+    release.set()
+    done = queue.wait(prefetch, 5)
+    assert done["status"] == DONE and done["result"] == "prefetch"
+    assert order == ["busy", "interactive", "prefetch"]
+
+    # A finished cacheable job is reused until its TTL expires
+    again = queue.submit("news", "interactive", work, "interactive")
+    assert again["id"] == interactive["id"] and again["status"] == DONE
+    assert queue.get(busy["id"])["status"] == DONE
+    queue.stop()
+
+
+def test_slow_endpoints_answer_with_a_job_handle():
+    reset_upstreams()
+    set_cache(MemoryCache())
+    profiles = {"finviz": UpstreamProfile(latency_ms=300), "translator": UpstreamProfile(), "gemini": UpstreamProfile()}
+    with Stubs(profiles).install(main):
+        client = TestClient(main.app)
+
+        accepted = client.get("/api/news/AAPL", headers={"Prefer": "respond-async"})
+        assert accepted.status_code == 202
+        job_id = accepted.headers["X-Job-Id"]
+        assert client.get(f"/api/jobs/{job_id}").json()["kind"] == "news"
+
+        main.jobs.wait(main.jobs.get(job_id), 5)
+        result = client.get(f"/api/jobs/{job_id}/result")
+        assert result.status_code == 200 and len(result.json()) > 0
+
+        # The finished job answers the endpoint right away
+        assert client.get("/api/news/AAPL").json() == result.json()
+
+        submitted = client.post("/api/jobs", json={"kind": "chart", "symbol": "AAPL"})
+        assert submitted.status_code in (200, 202)
+        record = main.jobs.wait(main.jobs.get(submitted.json()["id"]), 5)
+        assert record["status"] == DONE
+        assert len(client.get(f"/api/jobs/{record['id']}/result").json()) > 1000
+
+        # With the bars cached, the endpoint answers without creating another job
+        with mock.patch.object(main.jobs, "submit", side_effect=AssertionError("job submitted")):
+            chart = client.get("/api/chart/AAPL?period=max")
+        assert chart.status_code == 200 and len(chart.json()) > 1000
+
+        # Prefetched data is served inline, without a job handle
+        main._refresh_news("MSFT")
+        main._refresh_sentiment("MSFT")
+        with mock.patch.object(main.jobs, "submit", side_effect=AssertionError("job submitted")):
+            news = client.get("/api/news/MSFT", headers={"Prefer": "respond-async"})
+            sentiment = client.get("/api/sentiment/MSFT", headers={"Prefer": "respond-async"})
+        assert news.status_code == 200 and len(news.json()) > 0
+        assert sentiment.status_code == 200 and "score" in sentiment.json()
+
+        assert client.post("/api/jobs", json={"kind": "nope", "symbol": "AAPL"}).status_code == 400
+        assert client.get("/api/jobs/unknown").status_code == 404
+    reset_upstreams()
@@ -0,0 +1,66 @@
+import os
+import sys
+from datetime import date, datetime, timezone
+from unittest import mock
+
+# Add current directory to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.testclient import TestClient
+from yfinance.exceptions import YFPricesMissingError
+
+import main
+from bench.stubs import FakeTicker, Stubs
+from cache import MemoryCache, get_cache, set_cache
+from market_hours import CLOSED_SESSION_TTL, easter, exchange_for, is_open, market_ttl, session_ttl
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_exchange_calendar():
+    assert easter(2026) == date(2026, 4, 5)
+    assert exchange_for("SAN.MC").code == "BME"
+    assert exchange_for("AAPL").code == "NYSE"
+    assert exchange_for("BTC-USD") is None
+
+    # Wednesday 2026-10-14, 15:00 UTC: Madrid (17:00) and New York (11:00) are in session
+    assert is_open("SAN.MC", utc(2026, 10, 14, 15))
+    assert is_open("AAPL", utc(2026, 10, 14, 15))
+    # Good Friday and Thanksgiving
+    assert not is_open("SAN.MC", utc(2026, 4, 3, 10))
+    assert not is_open("AAPL", utc(2026, 11, 26, 16))
+    # Crypto trades on Sundays
+    assert is_open("BTC-USD", utc(2026, 10, 18, 3))
+
+
+def test_ttls_follow_the_market():
+    # 03:00 in Madrid: valid until the 09:00 open
+    assert market_ttl("SAN.MC", 30, utc(2026, 10, 14, 1)) == 6 * 3600
+    assert market_ttl("AAPL", 30, utc(2026, 10, 14, 15)) == 30
+    assert market_ttl("BTC-USD", 30, utc(2026, 10, 17, 12)) == 30
+    # Saturday noon in New York: until Monday 09:30
+    assert market_ttl("AAPL", 30, utc(2026, 10, 17, 16)) == 45.5 * 3600
+
+    # Past sessions are final; today's close isn't until the session ends
+    now = utc(2026, 10, 14, 15)
+    assert session_ttl("SAN.MC", date(2026, 10, 13), 300, now) == CLOSED_SESSION_TTL
+    assert session_ttl("SAN.MC", date(2026, 10, 14), 300, now) == 300
+    assert session_ttl("SAN.MC", date(2026, 10, 14), 300, utc(2026, 10, 14, 20)) == CLOSED_SESSION_TTL
+
+
+def test_price_at_errors_are_not_cached():
+    set_cache(MemoryCache())
+
+    def delisted(self, **kwargs):
+        raise YFPricesMissingError("AAPL", "")
+
+    with Stubs({}).install(main):
+        client = TestClient(main.app)
+        with mock.patch.object(FakeTicker, "history", delisted):
+            assert "error" in client.get("/api/price-at-date/AAPL/2024-03-06").json()
+        assert get_cache().get("price_at:AAPL:2024-03-06") == (None, False)
+
+        assert client.get("/api/price-at-date/AAPL/2024-03-06").json()["found_date"] == "2024-03-06"
+        assert get_cache().get("price_at:AAPL:2024-03-06")[1]
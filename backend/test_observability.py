@@ -0,0 +1,51 @@
+import os
+import sys
+
+# Add current directory to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from prometheus_client.parser import text_string_to_metric_families
+
+import main
+from bench.stubs import Stubs
+from cache import MemoryCache, set_cache
+
+
+def test_requests_are_measured_by_route_template():
+    set_cache(MemoryCache())
+    with Stubs({}).install(main):
+        client = TestClient(main.app)
+        assert client.get("/api/quote/AAPL").status_code == 200
+        assert client.get("/api/quote/MSFT").status_code == 200
+        metrics = client.get("/metrics")
+
+    assert metrics.status_code == 200
+    counts = {
+        sample.labels["route"]: sample.value
+        for family in text_string_to_metric_families(metrics.text)
+        for sample in family.samples
+        if sample.name == "bolsaia_request_duration_seconds_count" and sample.labels["status"] == "200"
+    }
+    # One series per route template, not per symbol
+    assert counts["/api/quote/{symbol}"] >= 2
+    assert not any("AAPL" in route for route in counts)
+    assert REGISTRY.get_sample_value("bolsaia_requests_in_flight") == 0
+
+
+def test_batch_quotes_time_fast_info_and_info_separately():
+    set_cache(MemoryCache())
+
+    def count(operation):
+        return REGISTRY.get_sample_value(
+            "bolsaia_upstream_duration_seconds_count", {"upstream": "yfinance", "operation": operation}) or 0
+
+    before = {op: count(op) for op in ("quote", "fast_info", "info")}
+    with Stubs({}).install(main):
+        client = TestClient(main.app)
+        assert client.post("/api/quotes", json={"symbols": ["AAPL"]}).status_code == 200
+
+    # The outer "quote" call keeps its span; fast_info and info get their own
+    for operation in before:
+        assert count(operation) > before[operation], operation
@@ -0,0 +1,35 @@
+import os
+import sys
+
+# Add current directory to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from cache import MemoryCache, set_cache
+from prefetch import PrefetchScheduler, PrefetchTask, SymbolRegistry
+from resilience import reset_upstreams
+
+
+def test_registry_tracks_portfolio_and_recent_symbols():
+    registry = SymbolRegistry(hot_ttl=60, max_symbols=2)
+    registry.set_portfolio_symbols(["san.mc"])
+    registry.touch(["aapl", "msft", "nvda"])
+    hot = registry.hot_symbols()
+    assert "SAN.MC" in hot
+    # Only the two most recent requested symbols are kept
+    assert len(hot - {"SAN.MC"}) == 2
+
+
+def test_only_one_worker_refreshes_per_period():
+    reset_upstreams()
+    set_cache(MemoryCache())
+    refreshed = []
+    task = PrefetchTask("quotes", 30, "yfinance", refreshed.append, market_hours_only=False)
+    first = PrefetchScheduler(SymbolRegistry(), rate=100)
+    second = PrefetchScheduler(SymbolRegistry(), rate=100)
+
+    first._execute(task, "AAPL")
+    second._execute(task, "AAPL")
+    assert refreshed == ["AAPL"]
+
+    first.stop()
+    second.stop()
@@ -0,0 +1,145 @@
+import os
+import sys
+from unittest import mock
+
+# Add current directory to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+from fastapi.testclient import TestClient
+from yfinance.exceptions import YFInvalidPeriodError
+
+import main
+from bench.stubs import FakeTicker, Stubs, UpstreamProfile
+from cache import MemoryCache, get_cache, set_cache
+from resilience import CircuitBreaker, TokenBucket, Upstream, UpstreamUnavailable, reset_upstreams
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _failing():
+    raise ConnectionError("upstream down")
+
+
+def test_breaker_opens_and_serves_stale():
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", min_calls=3, cooldown=10, clock=clock)
+    client = Upstream("test", rate=100, burst=100, retries=0, breaker=breaker)
+
+    assert client.call("k", lambda: 42) == (42, False)
+    for _ in range(3):
+        assert client.call("k", _failing) == (42, True)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # While open the upstream is not called at all
+    calls = []
+    assert client.call("k", lambda: calls.append(1)) == (42, True)
+    assert calls == []
+
+    # Without a last good value the caller gets UpstreamUnavailable
+    try:
+        client.call("other", lambda: 1)
+        assert False, "expected UpstreamUnavailable"
+    except UpstreamUnavailable:
+        pass
+
+    # After the cooldown one probe closes the breaker again
+    clock.now = 11
+    assert client.call("k", lambda: 43) == (43, False)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_invalid_requests_do_not_open_the_breaker():
+    breaker = CircuitBreaker("test", min_calls=3, cooldown=10, clock=FakeClock())
+    client = Upstream("test", rate=100, burst=100, retries=1, breaker=breaker)
+    calls = []
+
+    def bogus_period():
+        calls.append(1)
+        raise YFInvalidPeriodError("AAPL", "bogus", "1d, 5d, 1mo, max")
+
+    for _ in range(5):
+        try:
+            client.call("k", bogus_period)
+            assert False, "expected YFInvalidPeriodError"
+        except YFInvalidPeriodError:
+            pass
+    # Not retried and not counted as failures
+    assert len(calls) == 5
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert client.call("k", lambda: 1) == (1, False)
+
+
+def test_token_bucket_backs_off_on_throttle():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10, capacity=2, clock=clock)
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() > 0
+
+    bucket.throttle()
+    assert bucket.rate == 5
+    for _ in range(20):
+        bucket.recover()
+    assert bucket.rate == 10
+
+
+def test_endpoints_fall_back_to_stale_values():
+    reset_upstreams()
+    set_cache(MemoryCache())
+    profiles = {"finviz": UpstreamProfile(), "yfinance": UpstreamProfile(), "translator": UpstreamProfile()}
+    stubs = Stubs(profiles)
+    with stubs.install(main):
+        client = TestClient(main.app)
+
+        fresh = client.post("/api/quotes", json={"symbols": ["AAPL"]}).json()
+        news = client.get("/api/news/AAPL")
+        assert "stale" not in fresh["AAPL"]
+        assert news.headers.get("X-Data-Stale") is None
+
+        profiles["finviz"].failure_rate = 1.0
+        profiles["yfinance"].failure_rate = 1.0
+        # Expire the fresh entries; the last good copies stay
+        get_cache().delete("news:AAPL")
+        get_cache().delete("quotes:AAPL")
+
+        # Retries with backoff take longer than the default inline wait
+        with mock.patch.object(main, "JOB_INLINE_WAIT", 5):
+            stale_news = client.get("/api/news/AAPL")
+        assert stale_news.headers.get("X-Data-Stale") == "true"
+        assert stale_news.json() == news.json()
+
+        stale = client.post("/api/quotes", json={"symbols": ["AAPL", "MSFT"]}).json()
+        assert stale["AAPL"]["stale"] is True
+        assert stale["AAPL"]["price"] == fresh["AAPL"]["price"]
+        assert stale["MSFT"] == {"error": "N/A"}
+
+        # Blocked Finviz with nothing cached: no fake "bloqueado" item
+        assert client.get("/api/news/MSFT").json() == []
+    reset_upstreams()
+
+
+def test_empty_history_is_a_failure_not_a_value():
+    reset_upstreams()
+    set_cache(MemoryCache())
+    stubs = Stubs({"yfinance": UpstreamProfile()})
+    with stubs.install(main):
+        client = TestClient(main.app)
+        fresh = client.get("/api/chart/AAPL?period=1y")
+        assert len(fresh.json()) == 252
+
+        # yfinance hides some errors behind an empty frame
+        get_cache().delete("bars:AAPL:1y:1d")
+        with mock.patch.object(FakeTicker, "history", lambda self, **kwargs: pd.DataFrame()):
+            stale = client.get("/api/chart/AAPL?period=1y")
+        assert stale.headers.get("X-Data-Stale") == "true"
+        assert stale.json() == fresh.json()
+        last_good, found = get_cache().get("lastgood:yfinance:bars:AAPL:1y:1d")
+        assert found and len(last_good) == 252
+    reset_upstreams()
@@ -0,0 +1,75 @@
+import os
+import sys
+from unittest import mock
+
+# Add current directory to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import msgpack
+import numpy as np
+import pyarrow as pa
+from fastapi.testclient import TestClient
+from yfinance.exceptions import YFPricesMissingError
+from yfinance import utils as yf_utils
+
+import main
+from bench.stubs import FakeTicker, Stubs
+from wire import negotiate
+
+
+def test_negotiate_falls_back_to_json():
+    assert negotiate("application/json") is None
+    assert negotiate(None) is None
+    assert negotiate("application/x-msgpack, */*") == "msgpack"
+
+
+def test_chart_msgpack_matches_json():
+    with Stubs({}).install(main):
+        client = TestClient(main.app)
+        rows = client.get("/api/chart/AAPL?period=1y").json()
+        response = client.get("/api/chart/AAPL?period=1y", headers={"Accept": "application/msgpack"})
+
+    assert response.headers["content-type"] == "application/msgpack"
+    payload = msgpack.unpackb(response.content)
+    columns = payload["columns"]
+    assert payload["length"] == len(rows)
+
+    days = np.frombuffer(columns["date"]["data"], dtype="<i4")
+    assert str(np.datetime64(int(days[-1]), "D")) == rows[-1]["date"]
+    close = np.frombuffer(columns["close"]["data"], dtype="<f4")
+    assert np.allclose(close, [r["close"] for r in rows], rtol=1e-6)
+    assert columns["volume"]["dtype"] == "uint32"
+    assert np.frombuffer(columns["volume"]["data"], dtype="<u4").tolist() == [r["volume"] for r in rows]
+    # float32 columns and int32 dates: well under half of the JSON size
+    assert len(response.content) * 2 < len(main.json.dumps(rows))
+
+
+def test_chart_arrow_matches_json():
+    with Stubs({}).install(main):
+        client = TestClient(main.app)
+        rows = client.get("/api/chart/AAPL?period=1y").json()
+        response = client.get("/api/chart/AAPL?period=1y", headers={"Accept": "application/vnd.apache.arrow.stream"})
+
+    assert response.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.num_rows == len(rows)
+    assert table.schema.field("date").type == pa.date32()
+    assert table.column("date")[-1].as_py().isoformat() == rows[-1]["date"]
+    assert np.allclose(table.column("close").to_numpy(), [r["close"] for r in rows], rtol=1e-6)
+    assert table.schema.field("volume").type == pa.uint32()
+    assert table.column("volume").to_pylist() == [r["volume"] for r in rows]
+
+
+def test_empty_chart():
+    # yfinance's empty history has a plain Index and float64 columns
+    empty = main.compact_frame(yf_utils.empty_df(), main.BAR_COLUMNS).rename(columns=main.BAR_COLUMNS)
+    assert main.bars_to_records(empty) == []
+
+    def delisted(self, **kwargs):
+        raise YFPricesMissingError("ZZZZ", "")
+
+    with Stubs({}).install(main), mock.patch.object(FakeTicker, "history", delisted):
+        client = TestClient(main.app)
+        assert client.get("/api/chart/ZZZZ?period=1y").json() == []
+        response = client.get("/api/chart/ZZZZ?period=1y", headers={"Accept": "application/msgpack"})
+    assert msgpack.unpackb(response.content)["length"] == 0
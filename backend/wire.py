@@ -0,0 +1,138 @@
+"""
+Formatos de respuesta compactos para datos masivos (gráficos, dividendos, quotes en lote).
+
+Negociación por cabecera Accept:
+  - application/vnd.apache.arrow.stream -> Arrow IPC stream
+  - application/msgpack (o x-msgpack / vnd.msgpack) -> MessagePack columnar
+  - cualquier otra cosa -> JSON de siempre (lista de filas)
+
+Los datos llegan como columnas (numpy o listas). Las columnas numéricas se envían como
+bytes little-endian del array, sin convertir fila a fila. Las fechas diarias viajan como
+días desde epoch (int32) y las intradía como epoch en ms (float64). Con compact=True los
+floats se envían en float32, suficiente para pintar un gráfico; los enteros nunca se
+redondean (int32/uint32 tal cual, el resto como float64).
+
+Formato MessagePack:
+    {"length": n, "columns": {"close": {"dtype": "float32", "data": <bytes>},
+                              "date": {"dtype": "date_days", "data": <bytes int32>},
+                              "symbol": ["AAPL", ...]}}
+"""
+import numpy as np
+import pandas as pd
+from starlette.responses import Response
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_ALIASES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow responses are only offered when pyarrow is installed
+    pa = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def negotiate(accept):
+    """Devuelve 'arrow', 'msgpack' o None (JSON) según la cabecera Accept"""
+    accept = (accept or "").lower()
+    if ARROW_MEDIA_TYPE in accept and pa is not None:
+        return "arrow"
+    if any(alias in accept for alias in MSGPACK_ALIASES) and msgpack is not None:
+        return "msgpack"
+    return None
+
+
+def frame_columns(df, date_column="date"):
+    """Columnas de un DataFrame indexado por fecha, listas para columnar_response"""
+    columns = {date_column: df.index.values}
+    for name in df.columns:
+        columns[name] = df[name].values
+    return columns
+
+
+def _as_array(values):
+    if isinstance(values, np.ndarray):
+        return values
+    if isinstance(values, (pd.Index, pd.Series)):
+        return values.values
+    return None
+
+
+def _is_daily(dates):
+    return len(dates) == 0 or bool((dates == dates.astype("datetime64[D]")).all())
+
+
+# Integer types with a native JS typed array: sent as they are
+NATIVE_INTEGERS = (np.dtype(np.int32), np.dtype(np.uint32))
+
+
+def _numeric(array, compact):
+    if compact and array.dtype.kind == "f":
+        return array.astype("<f4", copy=False)
+    if array.dtype.kind in "iu" and array.dtype not in NATIVE_INTEGERS:
+        # JS has no native int64 arrays: send integers as float64 (exact up to 2**53)
+        return array.astype("<f8")
+    return array.astype(array.dtype.newbyteorder("<"), copy=False)
+
+
+def _msgpack_column(values, compact):
+    array = _as_array(values)
+    if array is None or array.dtype == object:
+        return list(values)
+    if np.issubdtype(array.dtype, np.datetime64):
+        if _is_daily(array):
+            days = array.astype("datetime64[D]").astype("<i4")
+            return {"dtype": "date_days", "data": days.tobytes()}
+        millis = array.astype("datetime64[ms]").astype(np.int64).astype("<f8")
+        return {"dtype": "date_ms", "data": millis.tobytes()}
+    if array.dtype == np.bool_:
+        return {"dtype": "bool", "data": array.astype(np.uint8).tobytes()}
+    array = _numeric(array, compact)
+    return {"dtype": array.dtype.name, "data": np.ascontiguousarray(array).tobytes()}
+
+
+def _arrow_column(values, compact):
+    array = _as_array(values)
+    if array is None or array.dtype == object:
+        return pa.array(list(values))
+    if np.issubdtype(array.dtype, np.datetime64):
+        if _is_daily(array):
+            return pa.array(array.astype("datetime64[D]"), type=pa.date32())
+        return pa.array(array.astype("datetime64[ms]"))
+    if compact and array.dtype.kind == "f":
+        # Only prices: integers (volume) keep their exact values
+        array = array.astype(np.float32, copy=False)
+    # Numeric numpy arrays without nulls are wrapped without copying
+    return pa.array(array)
+
+
+def columnar_response(columns, fmt, headers=None, compact=False):
+    """Respuesta Arrow o MessagePack a partir de un dict {nombre: columna}"""
+    length = len(next(iter(columns.values()))) if columns else 0
+    if fmt == "arrow":
+        batch = pa.record_batch([_arrow_column(v, compact) for v in columns.values()], names=list(columns))
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+        body = sink.getvalue().to_pybytes()
+        return Response(body, media_type=ARROW_MEDIA_TYPE, headers=headers)
+
+    payload = {"length": length, "columns": {name: _msgpack_column(v, compact) for name, v in columns.items()}}
+    body = msgpack.packb(payload, use_bin_type=True)
+    return Response(body, media_type=MSGPACK_MEDIA_TYPE, headers=headers)
+
+
+def compression_middleware():
+    """Brotli (con fallback a gzip) si brotli-asgi está instalado, si no gzip de Starlette"""
+    try:
+        from brotli_asgi import BrotliMiddleware
+
+        return BrotliMiddleware, {"minimum_size": 1000, "gzip_fallback": True}
+    except ImportError:
+        from starlette.middleware.gzip import GZipMiddleware
+
+        return GZipMiddleware, {"minimum_size": 1000}
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { BrowserRouter as Router, Routes, Route } from 'react-router-dom'; // Import Router components
 import { getQuote, getChartData, getNews, getDividends, getMarketSentiment, getPortfolios, savePortfolios } from './api/client';
 import StockSearch from './components/StockSearch';
@@ -29,6 +29,13 @@ const App = () => {
 
   const [portfolios, setPortfolios] = useState([]);
   const [isDataLoaded, setIsDataLoaded] = useState(false); // Flag to prevent overwriting with empty
+  const skipNextSave = useRef(false); // Set when the new state already comes from the backend
+
+  // Apply portfolios returned by the backend (e.g. a broker import) without POSTing them back
+  const applyServerPortfolios = (next) => {
+    skipNextSave.current = true;
+    setPortfolios(next);
+  };
 
   // LOAD PORTFOLIOS (Backend + Migration)
   useEffect(() => {
@@ -42,7 +49,7 @@ const App = () => {
 
       if (backendData && backendData.length > 0) {
         // Backend has data, use it (Single Source of Truth)
-        setPortfolios(backendData);
+        applyServerPortfolios(backendData);
       } else if (parsedLocal.length > 0) {
         // Backend is empty but Local has data -> MIGRATE
         console.log("Migrating local portfolios to backend...");
@@ -61,6 +68,11 @@ const App = () => {
   useEffect(() => {
     if (isDataLoaded) {
       // Only save if initial load is complete to avoid wiping DB with initial empty state
+      if (skipNextSave.current) {
+        skipNextSave.current = false;
+        localStorage.setItem('bolsa_portfolios', JSON.stringify(portfolios));
+        return;
+      }
       const saveToBackend = async () => {
         await savePortfolios(portfolios);
         // Also keep local updated just in case/fallback
@@ -233,7 +245,7 @@ const App = () => {
           </div>
         )}
 
-        {view === 'PORTFOLIO' && <div className="p-8"><PortfolioManager portfolios={portfolios} currentPrices={currentPrices} onUpdatePortfolios={setPortfolios} onBack={() => setView('DASHBOARD')} theme={theme} /></div>}
+        {view === 'PORTFOLIO' && <div className="p-8"><PortfolioManager portfolios={portfolios} currentPrices={currentPrices} onUpdatePortfolios={setPortfolios} onPortfoliosSynced={applyServerPortfolios} onBack={() => setView('DASHBOARD')} theme={theme} /></div>}
         {view === 'COMPOUND_INTEREST' && <CompoundInterestCalculator onBack={() => setView('DASHBOARD')} theme={theme} />}
         {view === 'PERCENTAGE_CALC' && <PercentageCalculator onBack={() => setView('DASHBOARD')} theme={theme} />}
       </div>
@@ -1,8 +1,18 @@
 
 import axios from 'axios';
+import { MSGPACK_MEDIA_TYPE, decodeColumnar, decodeQuotes, parseResponse } from './wire';
 
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000/api';
 
+// Opt-in compact format for bulk data (chart, dividends, batch quotes): VITE_API_WIRE_FORMAT=msgpack
+const USE_MSGPACK = import.meta.env.VITE_API_WIRE_FORMAT === 'msgpack';
+
+const bulkOptions = () => (USE_MSGPACK
+    ? { headers: { Accept: MSGPACK_MEDIA_TYPE }, responseType: 'arraybuffer' }
+    : {});
+
+const bulkData = (response, decoder) => (USE_MSGPACK ? parseResponse(response, decoder) : response.data);
+
 export const apiClient = axios.create({
     baseURL: API_URL,
     headers: {
@@ -10,6 +20,26 @@ export const apiClient = axios.create({
     },
 });
 
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// Slow analytics (news, sentiment, 'max' charts) run as background jobs. With this header the
+// API answers 202 with the job id right away instead of holding a server thread while it runs
+const ASYNC_HEADERS = { Prefer: 'respond-async' };
+
+const asyncOptions = (options = {}) => ({ ...options, headers: { ...options.headers, ...ASYNC_HEADERS } });
+
+// Poll the job's result with the same request options until it is ready
+const awaitJob = async (response, options = {}) => {
+    let current = response;
+    let delay = 500;
+    while (current.status === 202) {
+        await sleep(delay);
+        delay = Math.min(delay * 1.5, 3000);
+        current = await apiClient.get(`/jobs/${current.headers['x-job-id']}/result`, options);
+    }
+    return current;
+};
+
 export const getQuote = async (symbol) => {
     try {
         const response = await apiClient.get(`/quote/${symbol}`);
@@ -22,8 +52,11 @@ export const getQuote = async (symbol) => {
 
 export const getChartData = async (symbol, period = '1mo', interval = '1d') => {
     try {
-        const response = await apiClient.get(`/chart/${symbol}?period=${period}&interval=${interval}`);
-        return response.data;
+        const options = bulkOptions();
+        const response = await awaitJob(
+            await apiClient.get(`/chart/${symbol}?period=${period}&interval=${interval}`, asyncOptions(options)),
+            options);
+        return bulkData(response, decodeColumnar);
     } catch (error) {
         console.error("Error fetching chart:", error);
         throw error;
@@ -32,7 +65,7 @@ export const getChartData = async (symbol, period = '1mo', interval = '1d') => {
 
 export const getNews = async (symbol) => {
     try {
-        const response = await apiClient.get(`/news/${symbol}`);
+        const response = await awaitJob(await apiClient.get(`/news/${symbol}`, asyncOptions()));
         return response.data;
     } catch (error) {
         console.error("Error fetching news:", error);
@@ -52,8 +85,8 @@ export const searchStocks = async (query) => {
 
 export const getDividends = async (symbol) => {
     try {
-        const response = await apiClient.get(`/dividends/${symbol}`);
-        return response.data;
+        const response = await apiClient.get(`/dividends/${symbol}`, bulkOptions());
+        return bulkData(response, decodeColumnar);
     } catch (error) {
         console.error("Error fetching dividends:", error);
         return [];
@@ -62,8 +95,8 @@ export const getDividends = async (symbol) => {
 
 export const getBatchQuotes = async (symbols) => {
     try {
-        const response = await apiClient.post('/quotes', { symbols });
-        return response.data;
+        const response = await apiClient.post('/quotes', { symbols }, bulkOptions());
+        return bulkData(response, decodeQuotes);
     } catch (error) {
         console.error("Error fetching batch quotes:", error);
         return {};
@@ -82,7 +115,7 @@ export const getHistoricalPrice = async (symbol, date) => {
 
 export const getSentiment = async (symbol) => {
     try {
-        const response = await apiClient.get(`/sentiment/${symbol}`);
+        const response = await awaitJob(await apiClient.get(`/sentiment/${symbol}`, asyncOptions()));
         return response.data;
     } catch (error) {
         console.error("Error fetching sentiment:", error);
@@ -123,3 +156,16 @@ export const savePortfolios = async (portfolios) => {
         return null;
     }
 };
+
+export const importBrokerStatement = async (portfolioId, file) => {
+    try {
+        // The CSV goes as the raw body so the backend can stream it
+        const response = await apiClient.post(`/portfolios/${portfolioId}/import`, file, {
+            headers: { 'Content-Type': 'text/csv' },
+        });
+        return response.data;
+    } catch (error) {
+        console.error("Error importing broker statement:", error);
+        return null;
+    }
+};
@@ -0,0 +1,138 @@
+// Compact columnar wire format (MessagePack) for bulk endpoints: chart, dividends and batch quotes.
+// Opt-in with VITE_API_WIRE_FORMAT=msgpack. The decoders return the same shape as the JSON API,
+// so components don't need to change.
+
+export const MSGPACK_MEDIA_TYPE = 'application/msgpack';
+
+const textDecoder = new TextDecoder();
+
+// Minimal MessagePack decoder: covers every type the backend emits
+// (maps, arrays, strings, binary, floats, ints, bool and nil).
+const decodeMsgpack = (buffer) => {
+    const bytes = new Uint8Array(buffer);
+    const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+    let offset = 0;
+
+    const readString = (length) => {
+        const value = textDecoder.decode(bytes.subarray(offset, offset + length));
+        offset += length;
+        return value;
+    };
+    const readBinary = (length) => {
+        // Copy so typed arrays get an aligned buffer of their own
+        const value = bytes.slice(offset, offset + length);
+        offset += length;
+        return value;
+    };
+    const readArray = (length) => {
+        const value = new Array(length);
+        for (let i = 0; i < length; i++) value[i] = read();
+        return value;
+    };
+    const readMap = (length) => {
+        const value = {};
+        for (let i = 0; i < length; i++) {
+            const key = read();
+            value[key] = read();
+        }
+        return value;
+    };
+
+    const read = () => {
+        const type = bytes[offset++];
+        if (type <= 0x7f) return type;
+        if (type >= 0xe0) return type - 0x100;
+        if (type >= 0x80 && type <= 0x8f) return readMap(type & 0x0f);
+        if (type >= 0x90 && type <= 0x9f) return readArray(type & 0x0f);
+        if (type >= 0xa0 && type <= 0xbf) return readString(type & 0x1f);
+
+        let value;
+        switch (type) {
+            case 0xc0: return null;
+            case 0xc2: return false;
+            case 0xc3: return true;
+            case 0xc4: value = view.getUint8(offset); offset += 1; return readBinary(value);
+            case 0xc5: value = view.getUint16(offset); offset += 2; return readBinary(value);
+            case 0xc6: value = view.getUint32(offset); offset += 4; return readBinary(value);
+            case 0xca: value = view.getFloat32(offset); offset += 4; return value;
+            case 0xcb: value = view.getFloat64(offset); offset += 8; return value;
+            case 0xcc: value = view.getUint8(offset); offset += 1; return value;
+            case 0xcd: value = view.getUint16(offset); offset += 2; return value;
+            case 0xce: value = view.getUint32(offset); offset += 4; return value;
+            case 0xcf: value = Number(view.getBigUint64(offset)); offset += 8; return value;
+            case 0xd0: value = view.getInt8(offset); offset += 1; return value;
+            case 0xd1: value = view.getInt16(offset); offset += 2; return value;
+            case 0xd2: value = view.getInt32(offset); offset += 4; return value;
+            case 0xd3: value = Number(view.getBigInt64(offset)); offset += 8; return value;
+            case 0xd9: value = view.getUint8(offset); offset += 1; return readString(value);
+            case 0xda: value = view.getUint16(offset); offset += 2; return readString(value);
+            case 0xdb: value = view.getUint32(offset); offset += 4; return readString(value);
+            case 0xdc: value = view.getUint16(offset); offset += 2; return readArray(value);
+            case 0xdd: value = view.getUint32(offset); offset += 4; return readArray(value);
+            case 0xde: value = view.getUint16(offset); offset += 2; return readMap(value);
+            case 0xdf: value = view.getUint32(offset); offset += 4; return readMap(value);
+            default:
+                throw new Error(`Unsupported MessagePack type 0x${type.toString(16)}`);
+        }
+    };
+
+    return read();
+};
+
+const DAY_MS = 24 * 60 * 60 * 1000;
+
+const toDateString = (millis) => new Date(millis).toISOString().slice(0, 10);
+
+// Binary columns are little-endian typed arrays; dates come as epoch days or epoch ms
+const decodeColumn = (column) => {
+    if (Array.isArray(column)) return column;
+    const { buffer } = column.data;
+    switch (column.dtype) {
+        case 'float64': return new Float64Array(buffer);
+        // float32 is enough for charts; trim the float noise when widening to JS numbers
+        case 'float32': return Array.from(new Float32Array(buffer), (v) => Number(v.toPrecision(7)));
+        case 'int32': return new Int32Array(buffer);
+        case 'uint32': return new Uint32Array(buffer);
+        case 'bool': return Array.from(new Uint8Array(buffer), (v) => v === 1);
+        case 'date_days': return Array.from(new Int32Array(buffer), (d) => toDateString(d * DAY_MS));
+        case 'date_ms': return Array.from(new Float64Array(buffer), toDateString);
+        default:
+            throw new Error(`Unsupported column dtype ${column.dtype}`);
+    }
+};
+
+// { length, columns: { name: column } } -> [{ name: value, ... }, ...]
+export const decodeColumnar = (buffer) => {
+    const { length, columns } = decodeMsgpack(buffer);
+    const names = Object.keys(columns);
+    const decoded = names.map((name) => decodeColumn(columns[name]));
+    const rows = new Array(length);
+    for (let i = 0; i < length; i++) {
+        const row = {};
+        names.forEach((name, j) => { row[name] = decoded[j][i]; });
+        rows[i] = row;
+    }
+    return rows;
+};
+
+// Batch quotes: rows back to { SYMBOL: { price, change, ... } | { error } }
+export const decodeQuotes = (buffer) => {
+    const quotes = {};
+    decodeColumnar(buffer).forEach(({ symbol, error, stale, ...quote }) => {
+        if (error) {
+            quotes[symbol] = { error };
+        } else {
+            quotes[symbol] = stale ? { ...quote, stale } : quote;
+        }
+    });
+    return quotes;
+};
+
+// The server falls back to JSON when it can't produce the requested format
+export const parseResponse = (response, decoder) => {
+    const contentType = response.headers['content-type'] || '';
+    if (contentType.includes(MSGPACK_MEDIA_TYPE)) {
+        return decoder(response.data);
+    }
+    return JSON.parse(textDecoder.decode(response.data));
+};
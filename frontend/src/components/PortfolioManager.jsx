@@ -1,7 +1,7 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { motion, AnimatePresence } from 'framer-motion';
-import { Plus, Trash2, ArrowLeft, MoreVertical, Wallet, X, RefreshCw, Calendar, DollarSign, PieChart, TrendingUp, TrendingDown } from 'lucide-react';
-import { getHistoricalPrice, getBatchQuotes, getDividends, searchStocks } from '../api/client';
+import { Plus, Trash2, ArrowLeft, MoreVertical, Wallet, X, RefreshCw, Calendar, DollarSign, PieChart, TrendingUp, TrendingDown, Upload } from 'lucide-react';
+import { getHistoricalPrice, getBatchQuotes, getDividends, searchStocks, importBrokerStatement } from '../api/client';
 import { PieChart as RePieChart, Pie, Cell, Tooltip as ReTooltip, ResponsiveContainer, Legend, BarChart, Bar, XAxis, YAxis, CartesianGrid } from 'recharts';
 
 const COLORS = {
@@ -17,7 +17,7 @@ const COLORS = {
 
 const PIE_COLORS = ['#3B82F6', '#10B981', '#F59E0B', '#EF4444', '#8B5CF6', '#EC4899', '#06B6D4', '#0EA5E9'];
 
-const PortfolioManager = ({ portfolios, currentPrices = {}, onUpdatePortfolios, onBack, theme = 'dark' }) => {
+const PortfolioManager = ({ portfolios, currentPrices = {}, onUpdatePortfolios, onPortfoliosSynced = onUpdatePortfolios, onBack, theme = 'dark' }) => {
     const [selectedPortfolioId, setSelectedPortfolioId] = useState(null);
     const [showCreateForm, setShowCreateForm] = useState(false);
     const [newPortfolioName, setNewPortfolioName] = useState('');
@@ -266,6 +266,28 @@ const PortfolioManager = ({ portfolios, currentPrices = {}, onUpdatePortfolios,
         handleCancelEdit(); // Reset form and state
     };
 
+    // Broker CSV import (DEGIRO / IBKR): the backend resolves symbols and prices in bulk
+    const importInputRef = useRef(null);
+    const [isImporting, setIsImporting] = useState(false);
+
+    const handleImportFile = async (e) => {
+        const file = e.target.files[0];
+        e.target.value = '';
+        if (!file) return;
+
+        setIsImporting(true);
+        const result = await importBrokerStatement(selectedPortfolioId, file);
+        setIsImporting(false);
+
+        if (!result) {
+            window.alert('No se pudo importar el fichero');
+            return;
+        }
+        // The backend already saved the import: don't POST the whole list again
+        onPortfoliosSynced(portfolios.map(p => p.id === result.portfolio.id ? result.portfolio : p));
+        window.alert(`${result.imported} operaciones importadas${result.skipped ? `, ${result.skipped} filas omitidas` : ''}`);
+    };
+
     const handleDeleteHolding = (holdingId) => {
         const updatedPortfolios = portfolios.map(p => {
             if (p.id === selectedPortfolioId) {
@@ -535,12 +557,22 @@ const PortfolioManager = ({ portfolios, currentPrices = {}, onUpdatePortfolios,
                             <div className={`lg:col-span-2 rounded-2xl border ${bgClass}`}>
                                 <div className="p-4 border-b border-white/5 flex justify-between items-center">
                                     <h3 className={`font-bold ${textClass}`}>Operaciones</h3>
-                                    <button
-                                        onClick={() => setIsAddingHolding(true)}
-                                        className="flex items-center gap-2 px-3 py-1.5 bg-blue-600 hover:bg-blue-500 text-white rounded-lg text-sm transition-colors"
-                                    >
-                                        <Plus size={16} /> Añadir
-                                    </button>
+                                    <div className="flex items-center gap-2">
+                                        <input ref={importInputRef} type="file" accept=".csv,text/csv" className="hidden" onChange={handleImportFile} />
+                                        <button
+                                            onClick={() => importInputRef.current?.click()}
+                                            disabled={isImporting}
+                                            className={`flex items-center gap-2 px-3 py-1.5 rounded-lg text-sm transition-colors disabled:opacity-50 ${theme === 'dark' ? 'bg-white/10 hover:bg-white/20 text-white' : 'bg-gray-100 hover:bg-gray-200 text-gray-900'}`}
+                                        >
+                                            {isImporting ? <RefreshCw size={16} className="animate-spin" /> : <Upload size={16} />} Importar CSV
+                                        </button>
+                                        <button
+                                            onClick={() => setIsAddingHolding(true)}
+                                            className="flex items-center gap-2 px-3 py-1.5 bg-blue-600 hover:bg-blue-500 text-white rounded-lg text-sm transition-colors"
+                                        >
+                                            <Plus size={16} /> Añadir
+                                        </button>
+                                    </div>
                                 </div>
 
                                 <motion.form